@@ -0,0 +1,56 @@
+from collections import deque
+from typing import Dict, List, Tuple
+
+def build_automaton(patterns: List[str]) -> Tuple[List[Dict[str, int]], List[Tuple[int, ...]]]:
+    """
+    Builds an Aho-Corasick automaton, which finds every occurrence of any number of
+    patterns in a single pass over a text. The patterns are stored in a trie; every state
+    also gets a failure transition to the longest proper suffix of its path that is in the trie,
+    and inherits the outputs of that state, so matches ending inside longer matches are found too.
+    The failure transitions are folded into the transition table, so matching a character
+    is always one dictionary lookup.
+
+    Arguments:
+        patterns (List[str]): the patterns to look for.
+
+    Returns:
+        Tuple: the transitions of every state, and the indices of the patterns that end in every state.
+    """
+    goto, outputs = [{}], [set()]
+    for i, pattern in enumerate(patterns):
+        state = 0
+        for char in pattern:
+            if char not in goto[state]:
+                goto.append({})
+                outputs.append(set())
+                goto[state][char] = len(goto) - 1
+            state = goto[state][char]
+        outputs[state].add(i)
+
+    #breadth-first, so the failure state of every state is complete before it is used
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        outputs[state] |= outputs[fail[state]]
+        for char, next_state in goto[state].items():
+            fail[next_state] = goto[fail[state]].get(char, 0) if state != 0 else 0
+            queue.append(next_state)
+        #fold the failure transitions of the parent in, so no failure chain is followed while matching
+        for char, next_state in goto[fail[state]].items():
+            goto[state].setdefault(char, next_state)
+
+    return goto, [tuple(sorted(output)) for output in outputs]
+
+def find_patterns(automaton: Tuple, text: str) -> List[int]:
+    """
+    Returns the indices of the patterns occurring in a text, in ascending order.
+    """
+    goto, outputs = automaton
+    #an empty pattern occurs in every text
+    state, found = 0, set(outputs[0])
+    for char in text:
+        state = goto[state].get(char, 0)
+        if outputs[state]:
+            found.update(outputs[state])
+    return sorted(found)
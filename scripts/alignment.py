@@ -0,0 +1,134 @@
+from typing import Iterator, List, Sequence, Tuple
+
+def vertical_deltas(a: Sequence, b: Sequence) -> Iterator[Tuple[int, int]]:
+    """
+    Yields the columns of the edit distance matrix of two sequences, one for every element of 'b',
+    as the bit-vectors of Myers' bit-parallel algorithm: bit i of 'pv' is set where the distance goes
+    up by one from row i to row i + 1 of the column, and bit i of 'mv' where it goes down by one.
+    Every column is computed from the one before with a handful of bitwise operations, which takes
+    O(len(a) * len(b) / w) time, with w the number of bits processed in one machine operation.
+    'a' may not be empty.
+    """
+    m = len(a)
+    #the positions at which every symbol occurs in 'a'
+    peq = {}
+    for i, symbol in enumerate(a):
+        peq[symbol] = peq.get(symbol, 0) | (1 << i)
+
+    mask = (1 << m) - 1
+    pv, mv = mask, 0
+    for symbol in b:
+        eq = peq.get(symbol, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        #the top row of the matrix grows by one per element of 'b'
+        ph = (ph << 1) | 1
+        mh = mh << 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv & mask
+        yield pv, mv
+
+def distance(a: Sequence, b: Sequence) -> int:
+    """
+    Returns the Levenshtein distance between two sequences: the number of insertions,
+    deletions and substitutions needed to turn 'a' into 'b'. The sequences may be strings
+    (compared character by character) or lists of words or lines.
+
+    The distance is read from the last column of the matrix (see 'vertical_deltas'):
+    the top cell of column j holds j, and every bit of the column adds or subtracts one.
+    """
+    m = len(a)
+    if m == 0:
+        return len(b)
+    pv, mv = (1 << m) - 1, 0
+    for pv, mv in vertical_deltas(a, b):
+        pass
+    return len(b) + pv.bit_count() - mv.bit_count()
+
+def error_rate(predicted: Sequence, gold: Sequence) -> float:
+    """
+    Returns the error rate of a predicted sequence against the gold standard: the Levenshtein
+    distance divided by the length of the gold standard. Passing the characters of a page gives
+    its character error rate (CER), passing its words gives its word error rate (WER).
+    """
+    if len(gold) == 0:
+        return float(len(predicted) > 0)
+    return distance(gold, predicted) / len(gold)
+
+def edit_operations(a: Sequence, b: Sequence) -> List[Tuple[str, int, int]]:
+    """
+    Returns the edit operations of a minimal alignment of two sequences, which turn 'a' into 'b'.
+
+    The columns of the edit distance matrix are kept as the bit-vectors of 'vertical_deltas', and
+    the alignment is traced back from the bottom right corner along the optimal path only (after Hyyrö):
+    the distance in any cell is the column number plus the bits set in 'pv' above it, minus those set in 'mv'.
+    The traceback thus takes at most len(a) + len(b) steps, however far the path strays from the diagonal.
+
+    Arguments:
+        a (Sequence): the source sequence, e.g. the gold standard.
+        b (Sequence): the target sequence, e.g. the OCR output.
+
+    Returns:
+        List[Tuple[str, int, int]]: the operations in the order of the sequences, as
+        ("replace", i, j), ("delete", i, j) or ("insert", i, j) tuples, where i and j are
+        the positions in 'a' and 'b' at which the operation applies.
+    """
+    n, m = len(a), len(b)
+    if n == 0 or m == 0:
+        return [("insert", 0, j) for j in range(m)] + [("delete", i, 0) for i in range(n)]
+    columns = [((1 << n) - 1, 0)]
+    columns.extend(vertical_deltas(a, b))
+
+    def cell(i: int, j: int) -> int:
+        pv, mv = columns[j]
+        above = (1 << i) - 1
+        return j + (pv & above).bit_count() - (mv & above).bit_count()
+
+    operations = []
+    i, j = n, m
+    value = cell(i, j)
+    while i > 0 or j > 0:
+        if i > 0 and j > 0:
+            changed = a[i - 1] != b[j - 1]
+            diagonal = cell(i - 1, j - 1)
+            if value == diagonal + changed:
+                if changed:
+                    operations.append(("replace", i - 1, j - 1))
+                i, j, value = i - 1, j - 1, diagonal
+                continue
+        if i > 0:
+            up = cell(i - 1, j)
+            if value == up + 1:
+                operations.append(("delete", i - 1, j))
+                i, value = i - 1, up
+                continue
+        operations.append(("insert", i, j - 1))
+        j, value = j - 1, value - 1
+
+    operations.reverse()
+    return operations
+
+def aligned_pairs(a: Sequence, b: Sequence) -> List[Tuple]:
+    """
+    Returns the elements of two sequences paired up along a minimal alignment, as (a, b) tuples.
+    Elements that were deleted from 'a' are paired with None, as are elements inserted into 'b'.
+    """
+    pairs = []
+    i, j = 0, 0
+    for operation, op_i, op_j in edit_operations(a, b) + [("end", len(a), len(b))]:
+        #the elements between two operations are aligned with each other unchanged
+        while i < op_i and j < op_j:
+            pairs.append((a[i], b[j]))
+            i, j = i + 1, j + 1
+        if operation == "replace":
+            pairs.append((a[i], b[j]))
+            i, j = i + 1, j + 1
+        elif operation == "delete":
+            pairs.append((a[i], None))
+            i += 1
+        elif operation == "insert":
+            pairs.append((None, b[j]))
+            j += 1
+    return pairs
@@ -0,0 +1,66 @@
+import os
+import glob
+import time
+import argparse
+from typing import List, Tuple
+import alignment
+import ocr_analysis
+
+def page_pairs(collections: List[str], engine: str) -> List[Tuple[str, str, str]]:
+    """
+    Gathers the pages that have a gold standard, along with the output of the OCR engine for them,
+    as (page, gold standard path, OCR output path) tuples.
+    """
+    pairs = []
+    for collection in collections:
+        for gold_path in sorted(glob.glob(f"../ocr_analysis/gold_standard/{collection}/gs_*.txt")):
+            f = os.path.basename(gold_path)[3:-4]
+            if engine == "abbyy":
+                ocr_path = f"../ocr_output/txt_{collection}_abbyy/abb_{f}.txt"
+            else:
+                ocr_path = f"../ocr_output/txt_{collection}_tesseract/{f}.txt"
+            if os.path.exists(ocr_path):
+                pairs.append((f"{collection}_{f}", gold_path, ocr_path))
+    return pairs
+
+def time_alignment(gold: str, predicted: str, repeat: int) -> Tuple[float, int, int]:
+    """
+    Returns the best run time of 'alignment.edit_operations' over 'repeat' runs,
+    along with the number of operations it found and the Levenshtein distance they should add up to.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operations = alignment.edit_operations(gold, predicted)
+        best = min(best, time.perf_counter() - start)
+    return best, len(operations), alignment.distance(gold, predicted)
+
+def main():
+    p = argparse.ArgumentParser(description="Time the character alignment of the gold standard pages against the OCR output, \
+as used for the confusion pairs of 'ocr_analysis --errors'.")
+    p.add_argument("--collections", nargs="+", default=["jeake", "marescoe-david"], help="The collections whose pages are aligned.")
+    p.add_argument("--engine", choices=["tesseract", "abbyy"], default="tesseract", help="The OCR engine whose output is aligned.")
+    p.add_argument("--repeat", type=int, default=3, help="Number of runs per page; the best run is reported.")
+    p.add_argument("--limit", type=float, default=0.5, help="Number of seconds a single page may take.")
+    args = p.parse_args()
+
+    pairs = page_pairs(args.collections, args.engine)
+    print(f"{'page':<40}\t{'characters':>10}\t{'edits':>5}\t{'time (s)':>8}")
+    total, slow = 0.0, []
+    for page, gold_path, ocr_path in pairs:
+        gold_chars = ocr_analysis.open_files(gold_path)[0]
+        ocr_chars = ocr_analysis.open_files(ocr_path)[0]
+        seconds, n_operations, n_edits = time_alignment(gold_chars, ocr_chars, args.repeat)
+        if n_operations != n_edits:
+            print(f"Warning: {n_operations} operations found for {page}, while its distance is {n_edits}.")
+        if seconds > args.limit:
+            slow.append(page)
+        total += seconds
+        print(f"{page:<40}\t{len(gold_chars):>10}\t{n_edits:>5}\t{seconds:>8.3f}")
+
+    print(f"{len(pairs)} pages aligned in {total:.2f} seconds.")
+    if slow:
+        print(f"Warning: {len(slow)} page(s) took longer than {args.limit} seconds: {', '.join(slow)}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import time
+import importlib
+import argparse
+from typing import Dict, List, Tuple
+import corpus_index
+
+def scan_hits(texts: List[str], queries: List[str]) -> Dict[int, Dict[str, List[int]]]:
+    """
+    Rebuilds the former approach to the queries, in which every query is tested against
+    every token of every letter. Serves as the baseline to compare 'corpus_index.search' against.
+    """
+    results = {}
+    for nr, text in enumerate(texts):
+        hits = {}
+        for i, token in enumerate(corpus_index.tokenize(text or "")):
+            for query in queries:
+                if query in token.lower():
+                    hits.setdefault(query, []).append(i)
+        if hits:
+            results[nr] = hits
+    return results
+
+def time_search(search, repeat: int) -> Tuple[float, Dict]:
+    """
+    Returns the best run time of 'search' over 'repeat' runs, and the outcome of the last run.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = search()
+        best = min(best, time.perf_counter() - start)
+    return best, results
+
+def main():
+    p = argparse.ArgumentParser(description="Check that searching the inverted index finds the same hits as testing \
+every query against every token, on the queries of the query scripts, and time both.")
+    p.add_argument("--collections", nargs="+", default=["jeake", "marescoe-david"], help="The collections whose corpus is searched.")
+    p.add_argument("--short_queries", nargs="*", default=["ye", "th", "d"], help="Queries shorter than an n-gram, which are matched with the Aho-Corasick automaton, added to the ones of the query scripts.")
+    p.add_argument("--repeat", type=int, default=3, help="Number of runs per measurement; the best run is reported.")
+    args = p.parse_args()
+
+    print(f"{'collection':<16}\t{'queries':>7}\t{'letters':>7}\t{'scan (s)':>8}\t{'index (s)':>9}")
+    for collection in args.collections:
+        corpus_file = f"../corpus/corpus_{collection}.json"
+        texts = [record.get("TEXT") for record in corpus_index.read_records(corpus_file, ["TEXT"])]
+        index = corpus_index.build_index(corpus_index.read_records(corpus_file, ["SERIAL_NR", "PAGE", "TEXT"]))
+        query_script = importlib.import_module(f"query_corpus_{collection}")
+        for queries in [query_script.QUERIES, query_script.QUERIES + args.short_queries]:
+            scan_time, expected = time_search(lambda: scan_hits(texts, queries), args.repeat)
+            index_time, results = time_search(lambda: corpus_index.search(index, queries), args.repeat)
+            #the order of the queries within a letter matters as well, which comparing the dictionaries ignores
+            differing = [nr for nr in set(results) | set(expected) if list(results.get(nr, {}).items()) != list(expected.get(nr, {}).items())]
+            if differing or list(results) != list(expected):
+                print(f"Warning: hits differ in {len(differing)} letter(s) of {collection} for {queries}.")
+            print(f"{collection:<16}\t{len(queries):>7}\t{len(results):>7}\t{scan_time:>8.3f}\t{index_time:>9.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import os
+import re
+import json
+import importlib
+import time
+import argparse
+from typing import List, Tuple, Callable
+import utils
+
+def sequential_rules(rules: List[Tuple[str, str, str]]) -> Callable[[str], str]:
+    """
+    Rebuilds the former approach to the spelling corrections, in which every rule
+    is applied to the text with its own 're.sub', so the text is scanned once per rule.
+    Serves as the baseline to compare 'utils.compile_rules' against.
+    """
+    compiled = []
+    for pattern, replacement, boundary in rules:
+        if boundary == "word":
+            pattern = rf"\b{re.escape(pattern)}\b"
+        elif boundary == "start":
+            pattern = rf"\b{re.escape(pattern)}"
+        compiled.append((re.compile(pattern), replacement))
+
+    def correct(text: str) -> str:
+        for regex, replacement in compiled:
+            text = regex.sub(lambda match: replacement, text)
+        return text
+
+    return correct
+
+def grow_rules(rules: List[Tuple[str, str, str]], n_rules: int) -> List[Tuple[str, str, str]]:
+    """
+    Pads the rule table with made-up whole-word rules until it holds 'n_rules' rules.
+    The padding words do not occur in the corpora, so the output stays the same
+    and only the cost of checking the extra rules is measured.
+    """
+    grown = list(rules[:n_rules])
+    i = 0
+    while len(grown) < n_rules:
+        grown.append((f"Qxz{i}word", f"Qxz{i} word", "word"))
+        i += 1
+    return grown
+
+def load_texts(input_files: List[str]) -> List[str]:
+    """
+    Gathers the values of the keys cleaned by 'clean_spelling' from the .json corpora.
+    """
+    clean_keys = ["SALUTATION", "SIGN-OFF", "POSTSCRIPT", "NOTES", "FOOTNOTE", "TEXT"]
+    texts = []
+    for input_file in input_files:
+        with open(input_file, encoding="UTF-8") as file:
+            for entry in json.load(file):
+                texts.extend(entry[key] for key in clean_keys if key in entry)
+    return texts
+
+def load_raw_texts(master_dirs: List[str]) -> List[str]:
+    """
+    Assembles the letters from the corpus master files with the corpus scripts, and gathers the
+    values of their CLEAN_KEYS as 'clean_spelling' receives them: with normalised punctuation and
+    joined hyphenated words, but not yet corrected. Unlike the .json corpora, which were corrected
+    already, these hold every error the spelling rules are meant to fix.
+    """
+    texts = []
+    for master_dir in master_dirs:
+        collection = os.path.basename(os.path.normpath(master_dir)).replace("master_", "", 1)
+        corpus_script = importlib.import_module(f"corpus_{collection}")
+        for entry in corpus_script.generate_corpus(master_dir):
+            for key in corpus_script.CLEAN_KEYS:
+                if entry.get(key):
+                    texts.append(utils.remove_hyphens(utils.clean_punct(entry[key].strip("\n"))))
+    return texts
+
+def count_differences(table: List[Tuple[str, str, str]], texts: List[str]) -> int:
+    """
+    Returns the number of texts for which the single pass and the rules applied one by one disagree.
+    """
+    sequential, single = sequential_rules(table), utils.compile_rules(table)
+    return sum(sequential(text) != single(text) for text in texts)
+
+def time_corrector(build: Callable, table: List[Tuple[str, str, str]], texts: List[str], repeat: int) -> Tuple[float, List[str]]:
+    """
+    Returns the best run time over 'repeat' runs, and the output of the last run.
+    The corrector is rebuilt for every run, so compiling the rules is included in the timing.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        correct = build(table)
+        output = [correct(text) for text in texts]
+        best = min(best, time.perf_counter() - start)
+    return best, output
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark the single-pass spelling corrections against applying the rules one by one, \
+for a growing number of rules.")
+    p.add_argument("--input_files", nargs="+", default=["../corpus/corpus_jeake.json", "../corpus/corpus_marescoe-david.json"], help="Paths to the corpus .json files.")
+    p.add_argument("--master_dirs", nargs="+", default=["../corpus/master_jeake", "../corpus/master_marescoe-david"], help="Paths to the corpus master file folders, whose raw letters are corrected both ways to check that the outcome is the same.")
+    p.add_argument("--sizes", nargs="+", type=int, default=[25, 50, 100, 200, 400, 800], help="Numbers of rules to benchmark.")
+    p.add_argument("--repeat", type=int, default=3, help="Number of runs per measurement; the best run is reported.")
+    args = p.parse_args()
+
+    rules = utils.load_rules()
+    texts = load_texts(args.input_files)
+    print(f"{len(texts)} fields, {sum(len(text) for text in texts)} characters.")
+    raw_texts = load_raw_texts(args.master_dirs)
+    print(f"{len(raw_texts)} raw fields, {sum(len(text) for text in raw_texts)} characters.")
+    print(f"{'rules':>6}\t{'sequential (s)':>14}\t{'single pass (s)':>15}\t{'speedup':>7}")
+
+    for n_rules in args.sizes:
+        table = grow_rules(rules, n_rules)
+        sequential_time, sequential_output = time_corrector(sequential_rules, table, texts, args.repeat)
+        single_time, single_output = time_corrector(utils.compile_rules, table, texts, args.repeat)
+        if sequential_output != single_output:
+            print(f"Warning: outputs differ for {n_rules} rules.")
+        n_differences = count_differences(table, raw_texts)
+        if n_differences:
+            print(f"Warning: outputs differ on {n_differences} raw fields for {n_rules} rules.")
+        print(f"{n_rules:>6}\t{sequential_time:>14.3f}\t{single_time:>15.3f}\t{sequential_time / single_time:>6.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import json
+import pickle
+import hashlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+def file_digest(path: str) -> str:
+    """
+    Returns the SHA-256 hash of the contents of a file.
+    """
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+def text_digest(*parts: Any) -> str:
+    """
+    Returns the SHA-256 hash of a number of values, which are converted to strings first.
+    Strings and bytes are hashed as they are, other values through their JSON representation.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            digest.update(part)
+        elif isinstance(part, str):
+            digest.update(part.encode("UTF-8"))
+        else:
+            digest.update(json.dumps(part, ensure_ascii=False).encode("UTF-8"))
+        #separate the parts, so ("ab", "c") and ("a", "bc") do not share a hash
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+def load_cache(cache_dir: str, name: str) -> Dict:
+    """
+    Loads a cache from the cache folder. Returns an empty dictionary
+    if caching is disabled ('cache_dir' is None) or the cache does not exist yet.
+    """
+    if cache_dir is None:
+        return {}
+    cache_path = os.path.join(cache_dir, f"{name}.pickle")
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "rb") as file:
+            return pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+        #a damaged or outdated cache is simply rebuilt
+        return {}
+
+def save_cache(cache_dir: str, name: str, cache: Dict):
+    """
+    Saves a cache to the cache folder. The cache is written to a temporary file first,
+    so an interrupted run never leaves a half-written cache behind.
+    """
+    if cache_dir is None:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, f"{name}.pickle")
+    with open(f"{cache_path}.tmp", "wb") as file:
+        pickle.dump(cache, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{cache_path}.tmp", cache_path)
+
+def cached_imap(function: Callable[[List], Iterable], items: List, keys: List[str], cache_dir: str, name: str) -> Iterator:
+    """
+    Applies a function that maps a list of items to as many results, e.g. cleaning a list of letters,
+    but only to the items whose key is not in the cache. The results are yielded one at a time, in the
+    order of the items, as soon as they are taken from the cache or computed. The function may return
+    a generator, in which case the results can be written out while the remaining items are still
+    being processed. The cache is saved once the last result has been yielded, without the keys
+    that were not used in this run. Without a cache folder, no results are kept.
+
+    Arguments:
+        function (Callable): the function applied to the items missing from the cache.
+        items (List): the items to be processed.
+        keys (List[str]): the cache key of every item, typically a hash of its contents.
+        cache_dir (str): the cache folder, or None to disable caching.
+        name (str): the name of the cache.
+
+    Returns:
+        Iterator: the results for all items.
+    """
+    cache = load_cache(cache_dir, name)
+    results = iter(function([item for item, key in zip(items, keys) if key not in cache]))
+    used = {}
+    for key in keys:
+        result = cache[key] if key in cache else next(results)
+        if cache_dir is not None:
+            used[key] = result
+        yield result
+
+    save_cache(cache_dir, name, used)
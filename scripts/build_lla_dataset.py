@@ -1,143 +1,93 @@
 import os
 import argparse
-import pandas as pd
 import csv
-import statistics
-import lxml
-from lxml import etree
-from xml.etree.ElementTree import Element
-from typing import Tuple, Dict
-
-#GLOBALS
-HOCR_NS = "{http://www.w3.org/1999/xhtml}"
-
-def process_line(line: Element) -> Tuple:
+import math
+from operator import mul
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple, Dict, List, Iterator
+import hocr_reader
+
+def line_statistics(confidences: List[List[int]]) -> Tuple[List[float], List[float]]:
     """
-    Helper function for 'process_file'. This function focuses
-    on the individual lines in a page. It retrieves XHTML elements
-    on the word and line levels that will help the 'process_file'
-    construct a dictionary with all relevant info on an OCR scanned
-    page.
+    Helper function for 'page_rows'. Calculates the mean and the standard deviation of
+    the OCR's confidence values of the words in every line of a page, from the sum of the
+    values and the sum of their squares. The sums are whole numbers, so the results equal
+    those of the 'statistics' module. A page holds a few dozen lines of a few words each,
+    for which plain sums are cheaper than setting up arrays.
 
     Arguments:
-        line (Element): the XHTML element to be processed.
-    
+        confidences (List[List[int]]): the confidence values of the words of every line.
+
     Returns:
-        Tuple: A tuple containing relevant values of the page's line.
-            line_id = the current line's unique identifier.
-            coordinates = the bounding box coordinates of the line within the page.
-            line = the words within the line.
-            confidence = the OCR's confidence values of each word.
-            avg = the calculated mean of the confidence values within the current line.
-            stdev = the standard deviation of the confidence values within the current line.
+        Tuple: the means and the standard deviations, rounded to two decimals.
+            The standard deviation of a line with a single word is 0.0.
     """
-    conf_val, wordlist = [], []
-    #retrieve the children of XHTML element 'line'
-    children = line.getchildren()
-    for child in children:
-        #append textual content of child element to list
-        wordlist.append(child.text)
-        #iterate over the "title" attribute in the 'ocr_word' class
-        #the attribute is made up of two parts:
-        #'bbox 1312 232 1376 267; x_wconf 88'
-        #which are the bounding box coordinates, and the confidence value
-        for token in child.get("title").split("; "):
-            #split the confidence value token so we can isolate its numeric value
-            token = token.split(" ")
-        conf_val.append(token[1])
-    #cast each element of conf_val as an integer
-    conf_val = [int(i) for i in conf_val]
-    #get the unique identifier for the 'ocr_line' class
-    line_id = line.get('id')
-    #get the bounding box coordinates for the 'ocr_line' class
-    #which again is part of the 'title' attribute, made up of the following parts:
-    #'bbox 226 365 635 397; baseline 0 -5; x_size 33; x_descenders 7; x_ascenders 11'
-    coordinates = line.get('title').split(";")
-    coordinates = coordinates[0].split(" ")
-    coordinates = coordinates[1:] #we only want the numerical values
-    line = ' '.join(wordlist)
-    confidence = conf_val
-    avg = float(round(statistics.mean(conf_val), 2))
-    #set default standard deviation to 0.0 and only calculate this value
-    #in case there is more than one word in the line to avoid errors
-    stdev = 0.0
-    if len(conf_val) > 1:
-        stdev = round(statistics.stdev(conf_val), 2)
-
-    return (line_id, coordinates, line, confidence, avg, stdev)
-
-def process_file(file: str, writer: csv.writer, file_num: Dict) -> csv.writer:
+    means, stdevs = [], []
+    for values in confidences:
+        count, total = len(values), sum(values)
+        means.append(round(total / count, 2) if count else math.nan)
+        if count < 2:
+            stdevs.append(0.0)
+            continue
+        #the sum of the squared deviations, n * sum(x^2) - sum(x)^2, divided by n * (n - 1)
+        squares = sum(map(mul, values, values))
+        stdevs.append(round(math.sqrt((count * squares - total * total) / (count * (count - 1))), 2))
+
+    return means, stdevs
+
+def page_rows(file: str, file_num: Dict) -> List[List]:
     """
-    Process HOCR-files resulting from Tesseract page scans. With the helper function
-    'process_line', all words in every line on the scanned page, along with their
-    coordinates and confidence values are extracted. 'Process_file' gathers this
-    information into a dictionary, adds to those the page dimensions, and writes the
-    information to a data set in the form of a .csv file using the csv.writer object.
+    Process HOCR-files resulting from Tesseract page scans. All words in every line on the
+    scanned page, along with their coordinates and confidence values, are read in a single pass
+    with 'hocr_reader.scan_lines'. 'Page_rows' combines this information with the page
+    dimensions and the statistics of the confidence values of every line ('line_statistics')
+    into the rows of the data set, one for every line, in the order of the lines on the page.
 
     Arguments:
         file (str): the path to the HOCR file to be processed.
-        writer (csv.writer): the .csv writer object used to write the extracted data.
         file_num (Dict): a dictionary mapping the filenames to their respective file numbers.
 
     Returns:
-        csv.writer: the csv writer after writing the extracted data.
+        List[List]: the rows of the page's lines, with their values in the order of the headers defined in 'main'.
     """
-    #parse the lxml to find the page dimensions.
-    tree = lxml.etree.parse(file)
-    root = tree.getroot()
-    page_info = root.find(f'.//{HOCR_NS}div[@class="ocr_page"]')
-    page_info = page_info.get("title")
-    file_name = page_info.split('"')
-    file_name = file_name[1].split("\\")
-    file_name = file_name[-1]
-    page_dim = page_info.split(";")
-    page_dim = page_dim[1].split(" ")
-    page_dim = page_dim[2:]
-
-    #store the line location in a variable
-    lines = root.findall(f'.//{HOCR_NS}span[@class="ocr_line"]')
-
-    #iterate over the lines in the files to gather relevant information
-    for l in lines:
-        #call the process_line function and unpack the returned tuple into
-        #separate variables representing the processed information for that line
-        (line_id, coordinates, line, confidence, avg, stdev) = process_line(l)
-        #print(coordinates)
-        #print(line)
-        #print(confidence)
-
-        #skip pages that are flagged as "onnuttig" (useless)
-        if file_num[file_name] == "ONNUTTIG":
-            continue
+    page, lines = hocr_reader.scan_lines(file)
+    if not lines:
+        return []
 
-        #construct a dictionary containing the processed information for the current line
-        row = {
-            "Filename": file_name,
-            "File number": file_num[file_name],
-            "Line id": line_id,
-            "Line": line,
-            "Confidence": confidence,
-            "Average": avg,
-            "StDev": stdev
-        }
-        #create list of page locations representing the page coordinates
-        coor_pages = ["page left", "page top", "page right", "page bottom"]
-        #simultaneously iterate over the page dimensions (page_dim) and
-        #their respective representations in the coor_pages list
-        #and add these to the row dictionary, using the coor_page titles
-        #as keys and the page_dims as values
-        for cp,title in zip(page_dim, coor_pages):
-            row[title] = cp
-        #do the same for the line coordinates extracted from the process_line function
-        coor_titles = ["left", "top", "right", "bottom"]
-        for ct,title in zip(coordinates, coor_titles):
-            row[title] = ct
-
-        #write the 'row' dictionary as a csv
-        writer.writerow(row)
-    return writer
+    #the page title holds the path of the scanned image and the page dimensions:
+    #'image "C:\\...\\IMG_2021_12_23_11_51_10R.jpg"; bbox 0 0 1548 2465; ppageno 0; scan_res 340 340'
+    page_info = page.get("title")
+    file_name = page_info.split('"')[1].split("\\")[-1]
+    page_dim = page_info.split(";")[1].split(" ")[2:]
+
+    #skip pages that are flagged as "onnuttig" (useless)
+    if file_num[file_name] == "ONNUTTIG":
+        return []
 
-def main(input_file: str, output_file: str, folder_path: str) -> csv.writer:
+    averages, stdevs = line_statistics([confidence for _, _, _, confidence in lines])
+    rows = []
+    for (line_id, coordinates, words, confidence), avg, stdev in zip(lines, averages, stdevs):
+        #the columns follow the headers defined in 'main'
+        rows.append([file_name, file_num[file_name], *page_dim[:4], line_id, " ".join(words), confidence, avg, stdev, *coordinates[:4]])
+
+    return rows
+
+def build_rows(file_paths: List[str], file_num: Dict, workers: int = 1) -> Iterator[List[List]]:
+    """
+    Builds the rows of the HOCR-files with 'page_rows', in a process pool if more than
+    one worker is requested, and yields the rows of every page in the order of 'file_paths'.
+    """
+    if workers > 1 and len(file_paths) > 1:
+        chunksize = max(1, len(file_paths) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # executor.map returns the results in the order of the input files
+            yield from executor.map(partial(page_rows, file_num=file_num), file_paths, chunksize=chunksize)
+    else:
+        for file_path in file_paths:
+            yield page_rows(file_path, file_num)
+
+def main(input_file: str, output_file: str, folder_path: str, features: bool = False, header_pattern: str = None, workers: int = 1) -> csv.writer:
     #define a dictionary that will shape the features of dataset
     headers = {
             "Filename": "Filename",
@@ -167,43 +117,57 @@ def main(input_file: str, output_file: str, folder_path: str) -> csv.writer:
             output_file = f"{filename}({copy_number}){extention}"
         copy_number += 1
 
+    #Not possible to iterate as we normally would over the csv.reader object.
+    #Stating 'file_num[file_map["filename"]] = [file_map["pagenr"]]' will result in
+    #errors due to the csv reader object only recognising the headers --
+    #we need the filenames and their respective page numbers, though!
+
+    #Therefore, we first loop over the headers, then choose to continue.
+    #To access the actual information we need (filenames + page numbers),
+    #we need to skip the header row.
+    with open(input_file) as csvfile:
+        file_map = csv.reader(csvfile, delimiter=";")
+        file_num = {}
+        for i, row in enumerate(file_map):
+            if i == 0: #this is the header row
+                continue
+            #assign the second element [1](filenumber) of the row
+            #to the dictionary file_num using the first element [0]
+            #(filename) as a key
+            file_num[row[0]] = row[1]
+
+    #.DS_Store is a hidden file annoyingly generated on MacOS systems
+    #and will crash the loop if taken into consideration
+    #the files are sorted by name, so the rows are written in the same order on every system
+    file_paths = [os.path.join(folder_path, f) for f in sorted(os.listdir(folder_path)) if f != ".DS_Store"]
+
+    #the rows are built by the page_rows function, which assigns the file-/page number mapping
+    #with more than one worker, the pages are processed in parallel,
+    #but the rows are still written in the order of the files
+    rows = build_rows(file_paths, file_num, workers)
+    if features:
+        #imported here, as it needs pandas, which takes longer to import than the pages take to read
+        import lla_features
+        #the rows are gathered first, so a header pattern that matches no line
+        #is reported before anything is written, rather than after the plain dataset
+        rows = list(rows)
+        header_pattern = lla_features.find_header_pattern((row[7] for page in rows for row in page), header_pattern)
+
     #open a csv writer and write the dictionary keys as headers for
     #the rows in the dataset
 
     with open(output_file, 'w') as file:
-        writer = csv.DictWriter(file, fieldnames=headers)
-        writer.writerow(headers)
-
-        #Not possible to iterate as we normally would over the csv.reader object.
-        #Stating 'file_num[file_map["filename"]] = [file_map["pagenr"]]' will result in
-        #errors due to the csv reader object only recognising the headers --
-        #we need the filenames and their respective page numbers, though!
-
-        #Therefore, we first loop over the headers, then choose to continue.
-        #To access the actual information we need (filenames + page numbers),
-        #we need to skip the header row.
-        with open(input_file) as csvfile:
-            file_map = csv.reader(csvfile, delimiter=";")
-            file_num = {}
-            for i, row in enumerate(file_map):
-                if i == 0: #this is the header row
-                    continue
-                #assign the second element [1](filenumber) of the row
-                #to the dictionary file_num using the first element [0]
-                #(filename) as a key
-                file_num[row[0]] = row[1]
-
-        for f in os.listdir(folder_path):
-            #.DS_Store is a hidden file annoyingly generated on MacOS systems
-            #and will crash the loop if taken into consideration
-            if f == ".DS_Store":
-                continue
-            else:
-                file_path = os.path.join(folder_path, f)
-                #write .csv file using the information processed by
-                #the process_file function, and assign file-/page number
-                #mapping
-                writer = process_file(file_path, writer, file_num)
+        writer = csv.writer(file)
+        writer.writerow(headers.values())
+
+        #write .csv file using the rows of every page
+        for page in rows:
+            writer.writerows(page)
+
+    #add the geometric features for the annotation of the logical layout
+    #(see 'lla_features'), which used to be computed in a notebook
+    if features:
+        lla_features.add_features_to_csv(output_file, header_pattern=header_pattern)
 
     print(f"New file created: '{output_file}'.")
     return writer
@@ -214,6 +178,9 @@ filename + pagenumber .csv file to create a dataset to perform logical layout an
     p.add_argument("input_file", help="Path to input .csv with filenames and their corresponding pagenumbers.")
     p.add_argument("output_file", help="Output .csv filename generated by this script.")
     p.add_argument("folder_path", help="Path to the folder containing the HOCR output files.")    
+    p.add_argument("--workers", type=int, default=1, help="Number of processes used to parse the HOCR files.")
+    p.add_argument("--features", action="store_true", help="Add the geometric features (previous line distance, relative, corner and footer distances) to the dataset.")
+    p.add_argument("--header_pattern", type=str, default=None, help="Regular expression matching the running headers, against which the corner distances are measured. Defaults to the headers of the edition the pages come from (see 'lla_features'), or all lines if none match; an empty pattern measures against all lines.")
     args = p.parse_args()
 
     output_folder = "../logical_layout_analysis/data"
@@ -222,4 +189,7 @@ filename + pagenumber .csv file to create a dataset to perform logical layout an
     
     output_filename = os.path.join(output_folder, args.output_file)
 
-    main(args.input_file, output_filename, args.folder_path)
\ No newline at end of file
+    try:
+        main(args.input_file, output_filename, args.folder_path, args.features, args.header_pattern, args.workers)
+    except ValueError as e:
+        p.error(str(e))
\ No newline at end of file
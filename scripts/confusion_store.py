@@ -0,0 +1,167 @@
+import os
+import re
+import csv
+import json
+import argparse
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+import utils
+
+#globals
+#a page of the store is identified by these fields of its records
+PAGE_FIELDS = ["level", "collection", "file", "engine"]
+WORD = re.compile(r"\w+")
+
+def load_store(store_file: str) -> Dict[Tuple, Counter]:
+    """
+    Loads the confusion store: a stream of records, one JSON object per line, as written
+    by 'ocr_analysis', holding how often a gold standard character or word ("gold") was read
+    as another one ("predicted") on a page. None stands for a missing character or word.
+    Returns an empty store if the file does not exist yet.
+
+    Returns:
+        Dict[Tuple, Counter]: the pages, as (level, collection, file, engine) tuples,
+        mapped to the counts of their (gold, predicted) pairs.
+    """
+    store = {}
+    if not os.path.exists(store_file):
+        return store
+    with open(store_file, encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            page = tuple(record[field] for field in PAGE_FIELDS)
+            store.setdefault(page, Counter())[(record["gold"], record["predicted"])] += record["count"]
+    return store
+
+def merge(store: Dict[Tuple, Counter], records: Iterable[Dict]) -> Dict[Tuple, Counter]:
+    """
+    Merges the records of newly evaluated pages into the store.
+    The counts of a page replace those stored for it before, so evaluating
+    a page again never counts its pairs twice.
+    """
+    pages = {}
+    for record in records:
+        page = tuple(record[field] for field in PAGE_FIELDS)
+        pages.setdefault(page, Counter())[(record["gold"], record["predicted"])] += record["count"]
+    store.update(pages)
+    return store
+
+def save_store(store: Dict[Tuple, Counter], store_file: str):
+    """
+    Writes the store as a stream of records, sorted by page, with the pairs of every page
+    in the order in which they were first counted.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(store_file)), exist_ok=True)
+    with open(f"{store_file}.tmp", "w", encoding="utf-8") as file:
+        for page in sorted(store):
+            for (gold, predicted), count in store[page].items():
+                record = dict(zip(PAGE_FIELDS, page))
+                record.update({"gold": gold, "predicted": predicted, "count": count})
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(f"{store_file}.tmp", store_file)
+
+def totals(store: Dict[Tuple, Counter], level: str = "characters", engine: str = None,
+           collection: str = None, file: str = None) -> Counter:
+    """
+    Adds up the counts of the pairs over the pages of the store at the given level
+    ("characters" or "words"), optionally for a single engine, collection or file only.
+    """
+    counts = Counter()
+    for (page_level, page_collection, page_file, page_engine), pairs in store.items():
+        if page_level != level:
+            continue
+        if engine not in [None, page_engine] or collection not in [None, page_collection] or file not in [None, page_file]:
+            continue
+        counts.update(pairs)
+    return counts
+
+def top_k(store: Dict[Tuple, Counter], k: int = 10, gold: str = None, level: str = "characters",
+          engine: str = None, collection: str = None) -> List[Tuple[str, str, int]]:
+    """
+    Returns the k most frequent substitutions in the store, e.g. the characters
+    that "e" is most often read as. Pairs that were read correctly are left out.
+
+    Arguments:
+        store (Dict): the confusion store.
+        k (int): the number of substitutions to return.
+        gold (str): only return the substitutions of this character or word.
+        level (str): "characters" or "words".
+        engine (str): only count the pages read by this OCR engine, e.g. "tesseract".
+        collection (str): only count the pages of this collection.
+
+    Returns:
+        List[Tuple[str, str, int]]: the (gold, predicted, count) tuples, most frequent first.
+    """
+    counts = totals(store, level, engine, collection)
+    substitutions = Counter({pair: count for pair, count in counts.items()
+                             if pair[0] != pair[1] and (gold is None or pair[0] == gold)})
+    return [(pair_gold, predicted, count) for (pair_gold, predicted), count in substitutions.most_common(k)]
+
+def candidate_rules(store: Dict[Tuple, Counter], min_count: int = 2, engine: str = None,
+                    collection: str = None) -> List[Tuple[str, str, str]]:
+    """
+    Mines candidate spelling correction rules from the word substitutions in the store.
+    A misread word becomes a whole-word rule replacing it with the gold standard word when
+    both are made up of word characters only, the substitution occurs at least 'min_count'
+    times, and the misread word never occurs as a correctly read word, so the rule cannot
+    break correct text. Misread words that already have a rule in the spelling rules are skipped.
+
+    Returns:
+        List[Tuple[str, str, str]]: the (pattern, replacement, boundary) rules, most frequent first.
+    """
+    counts = totals(store, "words", engine, collection)
+    correct_words = {gold for gold, predicted in counts if gold == predicted}
+    known_patterns = {pattern for pattern, _, _ in utils.load_rules()}
+
+    substitutions = Counter()
+    for (gold, predicted), count in counts.items():
+        if gold is None or predicted is None or gold == predicted:
+            continue
+        if not (WORD.fullmatch(gold) and WORD.fullmatch(predicted)):
+            continue
+        if predicted in correct_words or predicted in known_patterns:
+            continue
+        substitutions[(predicted, gold)] += count
+
+    rules, seen = [], set()
+    #a misread word that was read for several gold words only gets a rule for the most frequent one
+    for (predicted, gold), count in substitutions.most_common():
+        if count < min_count or predicted in seen:
+            continue
+        seen.add(predicted)
+        rules.append((predicted, gold, "word"))
+    return rules
+
+def export_rules(rules: List[Tuple[str, str, str]], output_file: str):
+    """
+    Writes rules as a tab delimited table in the format of the spelling rules table,
+    so they can be reviewed and copied into 'spelling_rules.tsv'.
+    """
+    with open(output_file, "w", encoding="UTF-8", newline="") as file:
+        writer = csv.writer(file, delimiter="\t", quoting=csv.QUOTE_NONE, lineterminator="\n")
+        writer.writerow(["pattern", "replacement", "boundary"])
+        writer.writerows(rules)
+
+def main():
+    p = argparse.ArgumentParser(description="Query the OCR confusion store written by ocr_analysis --errors.")
+    p.add_argument("--store_file", type=str, default="../ocr_analysis/error_analysis_chars/confusion_pairs.jsonl", help="Path to the confusion store.")
+    p.add_argument("--gold", type=str, default=None, help="Only show the substitutions of this character or word.")
+    p.add_argument("--level", type=str, default="characters", choices=["characters", "words"], help="Whether to query character or word substitutions.")
+    p.add_argument("--engine", type=str, default=None, help="Only count the pages read by this OCR engine (abbyy or tesseract).")
+    p.add_argument("--collection", type=str, default=None, help="Only count the pages of this collection.")
+    p.add_argument("-k", type=int, default=10, help="Number of substitutions to show.")
+    p.add_argument("--export_rules", type=str, default=None, help="Write candidate spelling rules mined from the word substitutions to this .tsv file.")
+    p.add_argument("--min_count", type=int, default=2, help="Minimum number of times a word substitution must occur to become a candidate rule.")
+    args = p.parse_args()
+
+    store = load_store(args.store_file)
+    for gold, predicted, count in top_k(store, args.k, args.gold, args.level, args.engine, args.collection):
+        print(f"{json.dumps(gold, ensure_ascii=False)}\t{json.dumps(predicted, ensure_ascii=False)}\t{count}")
+
+    if args.export_rules:
+        rules = candidate_rules(store, args.min_count, args.engine, args.collection)
+        export_rules(rules, args.export_rules)
+        print(f"{len(rules)} candidate rules written to {args.export_rules}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import os
+import json
+import pickle
+import argparse
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Collection, Dict, Iterable, Iterator, List, Set
+import build_cache
+import aho_corasick
+import corpus_table
+import corpus_lines
+
+#globals
+INDEX_VERSION = 2
+NGRAM_SIZE = 3
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits a text into tokens on newlines and spaces, as the query scripts always did.
+    """
+    lines = text.split("\n")
+    tokens = []
+    for line in lines:
+        unhidden_tokens = [token for token in line.split(" ") if len(token) > 0]
+        tokens.extend(unhidden_tokens)
+
+    return tokens
+
+def ngrams(term: str) -> Set[str]:
+    """
+    Returns the character n-grams of a term.
+    """
+    return {term[i:i+NGRAM_SIZE] for i in range(len(term) - NGRAM_SIZE + 1)}
+
+def build_index(records: Iterable[Dict], corpus_digest: str = None) -> Dict:
+    """
+    Builds a positional inverted index over the "TEXT" field of the letters in a corpus.
+    Every lowercased token type in the corpus (the vocabulary) is mapped to the
+    (letter number, token position) pairs at which it occurs. To find the terms that
+    contain a query as a substring without scanning the whole vocabulary, the terms
+    are also indexed on their character n-grams. The text of the letters is not kept,
+    only their number of tokens, so the index does not hold the corpus itself: the keyword
+    in context lines are cut from the letters with hits as the corpus is read again (see 'read_tokens').
+
+    Arguments:
+        records (Iterable[Dict]): the letters of the corpus, as stored in the .json corpus.
+            They are read once, in order, so a generator of letters can be passed as well.
+        corpus_digest (str): hash of the corpus file the index was built from.
+
+    Returns:
+        Dict: the index.
+    """
+    letters, postings = [], defaultdict(list)
+    for nr, record in enumerate(records):
+        text = record.get("TEXT")
+        tokens = tokenize(text) if text else None
+        letters.append({"SERIAL_NR": record.get("SERIAL_NR"),
+                        "PAGE": record.get("PAGE", "NA"),
+                        "length": len(tokens) if tokens is not None else None
+                        })
+        for position, token in enumerate(tokens or []):
+            postings[token.lower()].append((nr, position))
+
+    vocabulary = sorted(postings)
+    term_ngrams = defaultdict(set)
+    for term_id, term in enumerate(vocabulary):
+        for ngram in ngrams(term):
+            term_ngrams[ngram].add(term_id)
+
+    return {"version": INDEX_VERSION,
+            "corpus_digest": corpus_digest,
+            "letters": letters,
+            "vocabulary": vocabulary,
+            "postings": dict(postings),
+            "ngrams": dict(term_ngrams)
+            }
+
+def save_index(index: Dict, index_file: str):
+    """
+    Saves the index as a pickle file.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(index_file)), exist_ok=True)
+    with open(index_file, "wb") as file:
+        pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+def read_records(corpus_file: str, columns: List[str]) -> Iterable[Dict]:
+    """
+    Reads the letters of a .json, .jsonl, .jsonl.gz or .parquet corpus, with the given columns.
+    A JSON Lines corpus is read one letter at a time; from a columnar corpus, only the given columns are read.
+    """
+    if corpus_file.endswith(".parquet"):
+        return corpus_table.read_corpus(corpus_file, columns=columns)
+    if corpus_lines.is_jsonl(corpus_file):
+        return corpus_lines.read_letters(corpus_file, columns=columns)
+    with open(corpus_file, "r", encoding="UTF-8") as file:
+        return json.load(file)
+
+def read_tokens(corpus_file: str, letter_numbers: Collection[int]) -> Iterator[List[str]]:
+    """
+    Reads the corpus the index was built from again, and yields the tokens of the given letters
+    (e.g. the ones with hits, see 'search'), in the order of the corpus. Only one letter is
+    tokenized at a time, and only the letters asked for.
+    """
+    for nr, record in enumerate(read_records(corpus_file, ["TEXT"])):
+        if nr in letter_numbers:
+            yield tokenize(record.get("TEXT") or "")
+
+def load_index(corpus_file: str, index_file: str) -> Dict:
+    """
+    Loads the index of a .json (or .jsonl, .jsonl.gz or .parquet) corpus. The index is (re)built and saved
+    to 'index_file' if it does not exist yet, or if the corpus changed since the index was built.
+    A JSON Lines corpus is indexed one letter at a time as it is read.
+
+    Arguments:
+        corpus_file (str): path to the .json, .jsonl, .jsonl.gz or .parquet corpus.
+        index_file (str): path to the index file.
+
+    Returns:
+        Dict: the index.
+    """
+    corpus_digest = build_cache.file_digest(corpus_file)
+    if os.path.exists(index_file):
+        with open(index_file, "rb") as file:
+            index = pickle.load(file)
+        if index.get("version") == INDEX_VERSION and index.get("corpus_digest") == corpus_digest:
+            return index
+
+    records = read_records(corpus_file, ["SERIAL_NR", "PAGE", "TEXT"])
+    index = build_index(records, corpus_digest)
+    save_index(index, index_file)
+    print(f"Index of {corpus_file} written to {index_file}.")
+    return index
+
+def lookup(index: Dict, query: str, mode: str = "substring") -> List[str]:
+    """
+    Returns the terms of the vocabulary that match a (lowercase) query.
+
+    Arguments:
+        index (Dict): the index.
+        query (str): the query.
+        mode (str): "substring" for terms containing the query, "prefix" for terms
+            starting with it, and "exact" for the query itself.
+
+    Returns:
+        List[str]: the matching terms.
+    """
+    vocabulary = index["vocabulary"]
+    if mode == "exact":
+        return [query] if query in index["postings"] else []
+    if mode == "prefix":
+        start = bisect_left(vocabulary, query)
+        end = start
+        while end < len(vocabulary) and vocabulary[end].startswith(query):
+            end += 1
+        return vocabulary[start:end]
+    if mode != "substring":
+        raise ValueError(f"Invalid mode '{mode}'. Expected 'substring', 'prefix' or 'exact'.")
+
+    if len(query) < NGRAM_SIZE:
+        #queries shorter than an n-gram are checked against the whole vocabulary
+        return [term for term in vocabulary if query in term]
+    candidates = None
+    for ngram in ngrams(query):
+        term_ids = index["ngrams"].get(ngram, set())
+        candidates = term_ids if candidates is None else candidates & term_ids
+        if not candidates:
+            return []
+    #the n-grams only narrow down the candidates; the substring itself must still be checked
+    return [vocabulary[term_id] for term_id in sorted(candidates) if query in vocabulary[term_id]]
+
+def match_terms(index: Dict, queries: List[str], mode: str = "substring") -> Dict[str, List[str]]:
+    """
+    Returns the terms of the vocabulary matching every query, see 'lookup'.
+    In substring mode, the queries shorter than an n-gram cannot be narrowed down
+    through the n-gram index; instead of scanning the vocabulary once for each of them,
+    they are all matched in a single pass with an Aho-Corasick automaton.
+    """
+    queries = list(dict.fromkeys(queries))
+    short = [query for query in queries if len(query) < NGRAM_SIZE] if mode == "substring" else []
+    terms = {query: [] for query in short}
+    if short:
+        automaton = aho_corasick.build_automaton(short)
+        for term in index["vocabulary"]:
+            for query_id in aho_corasick.find_patterns(automaton, term):
+                terms[short[query_id]].append(term)
+
+    for query in queries:
+        if query not in terms:
+            terms[query] = lookup(index, query, mode)
+    return terms
+
+def search(index: Dict, queries: List[str], mode: str = "substring") -> Dict[int, Dict[str, List[int]]]:
+    """
+    Finds the positions of the tokens matching the queries in every letter.
+    The result has the same structure as the 'hits' dictionaries the query scripts
+    built by scanning every token: per letter, the queries are listed in the order
+    in which they first occur in the letter, and their token positions are sorted.
+
+    Arguments:
+        index (Dict): the index.
+        queries (List[str]): the queries.
+        mode (str): the lookup mode, see 'lookup'.
+
+    Returns:
+        Dict: the letter numbers mapped to their hits, i.e. queries mapped to token positions.
+    """
+    letter_hits = defaultdict(dict)
+    for query, terms in match_terms(index, queries, mode).items():
+        for term in terms:
+            for nr, position in index["postings"][term]:
+                letter_hits[nr].setdefault(query, []).append(position)
+
+    #the rank of every query, to break ties between queries first occurring in the same token
+    rank = {query: i for i, query in enumerate(dict.fromkeys(queries))}
+    results = {}
+    for nr in sorted(letter_hits):
+        hits = letter_hits[nr]
+        for positions in hits.values():
+            positions.sort()
+        ordered = sorted(hits, key=lambda query: (hits[query][0], rank[query]))
+        results[nr] = {query: hits[query] for query in ordered}
+    return results
+
+def kwic(tokens: List[str], position: int, window: int):
+    """
+    Returns the keyword in context of the token at the given position:
+    the tokens to its left, the token itself, and the tokens to its right.
+    """
+    left = tokens[max(position-window, 0):position]
+    hit = tokens[position]
+    #the right context stops one token short of the end of the letter,
+    #which keeps the output identical to the datasets built before
+    right = tokens[position+1:min(position+window+1, len(tokens)-1)]
+    return left, hit, right
+
+def main():
+    p = argparse.ArgumentParser(description="Build the inverted index of a corpus, or search it.")
+    p.add_argument("corpus_file", type=str, help="Path to the corpus .json, .jsonl(.gz) or .parquet file.")
+    p.add_argument("index_file", type=str, help="Path to the index file. It is built if it does not exist or is outdated.")
+    p.add_argument("--queries", nargs="*", default=[], help="Queries to look up in the index.")
+    p.add_argument("--mode", type=str, default="substring", choices=["substring", "prefix", "exact"], help="How the queries are matched against the tokens.")
+    p.add_argument("--window", type=int, default=5, help="Number of context tokens shown on either side of a hit.")
+    args = p.parse_args()
+
+    index = load_index(args.corpus_file, args.index_file)
+    letter_hits = search(index, args.queries, args.mode)
+    for (nr, hits), tokens in zip(letter_hits.items(), read_tokens(args.corpus_file, letter_hits)):
+        letter = index["letters"][nr]
+        for query, positions in hits.items():
+            for position in positions:
+                left, hit, right = kwic(tokens, position, args.window)
+                print(f'{letter["SERIAL_NR"]}\t{query}\t{" ".join(left)} [{hit}] {" ".join(right)}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import gzip
+import json
+import argparse
+from typing import Dict, IO, Iterable, Iterator, List
+
+def is_jsonl(path: str) -> bool:
+    """
+    Whether a corpus file is a JSON Lines corpus (.jsonl, or .jsonl.gz if compressed).
+    """
+    return path.endswith((".jsonl", ".jsonl.gz"))
+
+def open_lines(path: str, mode: str = "r") -> IO[str]:
+    """
+    Opens a JSON Lines corpus as text, through gzip if the file name ends in .gz.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, f"{mode}t", encoding="UTF-8")
+    return open(path, mode, encoding="UTF-8")
+
+def write_letters(letters: Iterable[Dict], output_path: str) -> int:
+    """
+    Saves a corpus as JSON Lines: one letter per line, as a JSON object.
+    Every letter is written as soon as it comes in, so the letters can be passed
+    as a generator (e.g. 'clean_corpus') and never all have to be held in memory.
+
+    Arguments:
+        letters (Iterable[Dict]): the letters of the corpus.
+        output_path (str): path to the .jsonl file, or .jsonl.gz to compress it with gzip.
+
+    Returns:
+        int: the number of letters written.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    n_letters = 0
+    with open_lines(output_path, "w") as file:
+        for letter in letters:
+            file.write(json.dumps(letter, ensure_ascii=False) + "\n")
+            n_letters += 1
+    return n_letters
+
+def read_letters(input_path: str, columns: List[str] = None) -> Iterator[Dict]:
+    """
+    Reads a JSON Lines corpus one letter at a time.
+
+    Arguments:
+        input_path (str): path to the .jsonl or .jsonl.gz corpus.
+        columns (List[str]): the keys to keep, or None for all keys, e.g. ["SERIAL_NR", "TEXT"].
+
+    Returns:
+        Iterator[Dict]: the letters, in the order of the corpus.
+    """
+    with open_lines(input_path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            letter = json.loads(line)
+            if columns is not None:
+                letter = {key: value for key, value in letter.items() if key in columns}
+            yield letter
+
+def main():
+    p = argparse.ArgumentParser(description="Convert a .json corpus to a JSON Lines corpus, with one letter per line.")
+    p.add_argument("input_file", type=str, help="Path to the corpus .json file.")
+    p.add_argument("--output_file", type=str, default=None, help="Path to the output .jsonl file, or .jsonl.gz to compress it. Defaults to the input file with the .jsonl extension.")
+    args = p.parse_args()
+
+    with open(args.input_file, "r", encoding="UTF-8") as file:
+        corpus = json.load(file)
+    output_file = args.output_file or f"{os.path.splitext(args.input_file)[0]}.jsonl"
+    write_letters(corpus, output_file)
+    print(f"{os.path.basename(output_file)} written to {os.path.dirname(output_file) or '.'}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Iterator
+import hocr_reader
+import build_cache
+
+#globals
+LineRecord = namedtuple("LineRecord", ["file_name",
+                                       "page_number",
+                                       "paragraph_nr",
+                                       "paragraph_id",
+                                       "line_nr",
+                                       "annotation",
+                                       "text",
+                                       "words"
+                                       ])
+
+def parse_page(filepath: str) -> List[LineRecord]:
+    """
+    Reduces a .hocr master file to a flat list of line records, holding all that
+    the corpus scripts need to assemble the letters: the page number, the paragraph
+    the line belongs to, its annotation and its (corrected) text.
+    The words of every line are kept along with the OCR's confidence value (x_wconf)
+    of each word, as (word, x_wconf) pairs. The words of manually corrected lines
+    have no confidence value, and are paired with None instead.
+
+    Arguments:
+        filepath (str): the path to the .hocr master file.
+
+    Returns:
+        List[LineRecord]: the records of the lines on the page, in reading order.
+    """
+    file_name = os.path.basename(filepath)
+    pagenumber = None
+    paragraph_nr, paragraph_id, line_nr = -1, None, 0
+
+    records = []
+    for event, attributes in hocr_reader.iter_hocr(filepath, words=True):
+        if event == "page" and pagenumber is None:
+            pagenumber = attributes.get("page_number")
+        elif event == "paragraph":
+            paragraph_nr += 1
+            paragraph_id = attributes.get("id")
+            line_nr = 0
+        elif event == "line":
+            # make sure the script gathers the corrected lines instead of the original ones
+            line_correction = attributes.get("line_correction")
+            textline = line_correction if line_correction != "nan" else attributes.get("line")
+            if line_correction == "nan":
+                words = tuple(zip(attributes["words"], attributes["x_wconf"]))
+            else:
+                words = tuple((word, None) for word in (textline or "").split())
+            records.append(LineRecord(file_name,
+                                      pagenumber,
+                                      paragraph_nr,
+                                      paragraph_id,
+                                      line_nr,
+                                      attributes.get("annotation"),
+                                      textline,
+                                      words
+                                      ))
+            line_nr += 1
+
+    return records
+
+def parse_pages(file_paths: List[str], workers: int = 1) -> Iterator[List[LineRecord]]:
+    """
+    Parses the .hocr master files with 'parse_page', in a process pool if more than
+    one worker is requested, and yields the records of every page in the order of 'file_paths'.
+    """
+    if workers > 1 and len(file_paths) > 1:
+        chunksize = max(1, len(file_paths) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # executor.map returns the results in the order of the input files
+            yield from executor.map(parse_page, file_paths, chunksize=chunksize)
+    else:
+        for filepath in file_paths:
+            yield parse_page(filepath)
+
+def read_pages(input_dir: str, workers: int = 1, cache_dir: str = None) -> Iterator[LineRecord]:
+    """
+    Yields the line records of all .hocr master files in the input directory,
+    sorted by filename and by the order of the lines within each page.
+    With more than one worker, the pages are parsed in a process pool; the
+    results are still yielded in filename order, so the letters are assembled
+    exactly as in a serial build.
+    With a cache folder, the records of every page are stored along with a hash of
+    the file's contents, and only the pages that changed since the last run are parsed.
+
+    Arguments:
+        input_dir (str): the folder containing the .hocr master files.
+        workers (int): the number of processes used to parse the pages.
+        cache_dir (str): the folder holding the build cache, or None to parse every page.
+
+    Returns:
+        Iterator[LineRecord]: the line records of the whole corpus.
+    """
+    # make sure you don't let the script iterate over the files in randomised sequence (default),
+    # otherwise it will assign wrong values to keys
+    file_paths = [os.path.join(input_dir, file_name) for file_name in sorted(os.listdir(input_dir)) if file_name.endswith(".hocr")]
+
+    if cache_dir is None:
+        for records in parse_pages(file_paths, workers):
+            yield from records
+        return
+
+    cache_name = f"pages_{os.path.basename(os.path.normpath(input_dir))}"
+    cache = build_cache.load_cache(cache_dir, cache_name)
+    #the records are parsed again whenever this module changes what they hold
+    version = build_cache.file_digest(__file__)
+    digests = {filepath: build_cache.text_digest(build_cache.file_digest(filepath), version) for filepath in file_paths}
+    dirty = [filepath for filepath in file_paths if cache.get(os.path.basename(filepath), (None, None))[0] != digests[filepath]]
+
+    for filepath, records in zip(dirty, parse_pages(dirty, workers)):
+        cache[os.path.basename(filepath)] = (digests[filepath], records)
+
+    #only keep the pages that are still in the input folder
+    cache = {os.path.basename(filepath): cache[os.path.basename(filepath)] for filepath in file_paths}
+    build_cache.save_cache(cache_dir, cache_name, cache)
+
+    for filepath in file_paths:
+        yield from cache[os.path.basename(filepath)][1]
@@ -0,0 +1,107 @@
+import os
+import json
+import argparse
+from typing import Dict, List
+
+#globals
+#pyarrow, imported by 'require_pyarrow' once it is needed
+pa = pq = None
+#the columns stored as integers; all other columns are stored as text
+INTEGER_COLUMNS = ["PAGE", "N_WORDS", "YEAR", "OCR_CONFIDENCE"]
+#letters per row group: the statistics of every row group let readers skip the ones a filter rules out
+ROW_GROUP_SIZE = 64
+
+def require_pyarrow():
+    """
+    Imports pyarrow, which is only needed for the columnar output, the first time it is needed,
+    so the scripts that import this module do not pay for it on every run without .parquet files.
+    Raises an ImportError if pyarrow is not installed.
+    """
+    global pa, pq
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("The columnar corpus output requires pyarrow. You may need to pip install pyarrow.")
+        pa, pq = pyarrow, pyarrow.parquet
+
+def to_integer(value):
+    """
+    Converts a value to an integer. Values that are not whole numbers, such as an empty
+    "YEAR" of a letter whose year could not be read from its dateline, become missing values.
+    """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+def to_table(corpus: List[Dict]) -> "pa.Table":
+    """
+    Converts a corpus to an Arrow table with one row per letter and one column per key.
+    The columns are ordered by the first letter in which every key occurs, as in the .json corpus.
+    Keys missing from a letter become missing values.
+    """
+    require_pyarrow()
+    columns = list(dict.fromkeys(key for entry in corpus for key in entry))
+    arrays, fields = [], []
+    for column in columns:
+        values = [entry.get(column) for entry in corpus]
+        if column in INTEGER_COLUMNS:
+            arrays.append(pa.array([to_integer(value) for value in values], type=pa.int32()))
+            fields.append(pa.field(column, pa.int32()))
+        else:
+            arrays.append(pa.array([None if value is None else str(value) for value in values], type=pa.string()))
+            fields.append(pa.field(column, pa.string()))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+def save_parquet(corpus: List[Dict], output_path: str):
+    """
+    Saves a corpus as a Parquet file, a columnar format from which single columns,
+    or the letters matching a filter, can be read without reading the rest of the file.
+    """
+    require_pyarrow()
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    pq.write_table(to_table(corpus), output_path, row_group_size=ROW_GROUP_SIZE)
+
+def read_table(input_path: str, columns: List[str] = None, filters=None) -> "pa.Table":
+    """
+    Reads a Parquet corpus as an Arrow table.
+    Only the requested columns are read, and row groups that cannot hold any letters
+    matching the filters are skipped.
+
+    Arguments:
+        input_path (str): path to the .parquet corpus.
+        columns (List[str]): the columns to read, or None for all columns, e.g. ["SERIAL_NR", "TEXT"].
+        filters: conditions the letters must meet, in pyarrow's format, e.g. [("YEAR", "=", 1668)].
+
+    Returns:
+        pa.Table: the selected columns of the matching letters.
+    """
+    require_pyarrow()
+    return pq.read_table(input_path, columns=columns, filters=filters)
+
+def read_corpus(input_path: str, columns: List[str] = None, filters=None) -> List[Dict]:
+    """
+    Reads a Parquet corpus as a list of dictionaries, like the .json corpus.
+    Missing values are left out of the letters, as the keys were in the .json corpus.
+    See 'read_table' for the arguments.
+    """
+    table = read_table(input_path, columns, filters)
+    return [{key: value for key, value in row.items() if value is not None} for row in table.to_pylist()]
+
+def main():
+    p = argparse.ArgumentParser(description="Convert a .json corpus to a columnar .parquet corpus.")
+    p.add_argument("input_file", type=str, help="Path to the corpus .json file.")
+    p.add_argument("--output_file", type=str, default=None, help="Path to the output .parquet file. Defaults to the input file with the .parquet extension.")
+    args = p.parse_args()
+
+    with open(args.input_file, "r", encoding="UTF-8") as file:
+        corpus = json.load(file)
+    output_file = args.output_file or f"{os.path.splitext(args.input_file)[0]}.parquet"
+    save_parquet(corpus, output_file)
+    print(f"{os.path.basename(output_file)} written to {os.path.dirname(output_file) or '.'}.")
+
+if __name__ == "__main__":
+    main()
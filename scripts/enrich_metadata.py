@@ -4,6 +4,9 @@ import argparse
 import numpy as np
 import pandas as pd
 
+#globals
+SENTINELS = ["UNK", "MULT"]
+
 def load_file(input_df, sheet_name):
     """
     Loads the file specified by the user in the command line.
@@ -47,6 +50,46 @@ def load_file(input_df, sheet_name):
         print(e)
         sys.exit(1)
 
+def labels(conditions: list, choices: list, default=None) -> list:
+    """
+    Selects a label for every row, from the first condition that holds,
+    and returns the labels as a list, so the new column is typed exactly
+    like the columns that were built row by row.
+    Choices may be single labels or arrays holding a label for every row.
+    """
+    choice = np.select(conditions, range(len(conditions)), default=len(conditions))
+    selected = np.empty(len(choice), dtype=object)
+    for i, label in enumerate(list(choices) + [default]):
+        mask = choice == i
+        selected[mask] = label[mask] if isinstance(label, np.ndarray) else label
+    return selected.tolist()
+
+def year_values(column: pd.Series) -> tuple:
+    """
+    Splits a column of (birth) years into its numeric values and the masks the
+    derived columns are built from. A column of years holds few distinct values,
+    so they are only inspected once, and mapped back onto the rows.
+
+    Returns:
+        tuple: the years as floats (NaN where the value is not a number), the mask of values
+        that are present, the masks of the "UNK" and "MULT" sentinels, and the mask of text values.
+    """
+    codes, uniques = pd.factorize(column)
+    uniques = pd.Series(uniques.to_numpy(dtype=object), dtype=object)
+    is_text = uniques.map(type).eq(str).to_numpy()
+    is_sentinel = uniques.isin(SENTINELS).to_numpy()
+    numbers = pd.to_numeric(uniques.where(~is_sentinel), errors="coerce").to_numpy(dtype=float)
+
+    # missing values are factorized to -1, which picks the value appended at the end
+    def expand(values: np.ndarray, missing) -> np.ndarray:
+        return np.append(values, missing)[codes]
+
+    return (expand(numbers, np.nan),
+            codes != -1,
+            expand(uniques.eq("UNK").to_numpy(), False),
+            expand(uniques.eq("MULT").to_numpy(), False),
+            expand(is_text, False))
+
 def age_diff_bool(df, col_a: str, col_b: str) -> pd.DataFrame:
     """
     Calculates the age difference between two correspondents by subtracting their birth dates.
@@ -64,27 +107,17 @@ def age_diff_bool(df, col_a: str, col_b: str) -> pd.DataFrame:
         that checks whether there is an age gap of over 20 years between the sender
         and addressee.
     """
-    age_diff_labels = []
-
-    for index, row in df.iterrows():
-        sender_year = row[col_a]
-        addressee_year = row[col_b]
-        if pd.notna(sender_year) or pd.notna(addressee_year):
-            if sender_year in  ["MULT"] and addressee_year in ["MULT"]:
-                age_diff = "MULT"
-            elif sender_year in ["UNK", "MULT"] or addressee_year in ["UNK", "MULT"]:
-                age_diff = "UNK"
-            else:
-                difference = abs(sender_year - addressee_year)
-                if difference >= 20:
-                    age_diff = "TRUE"
-                else:
-                    age_diff = "FALSE"
-            age_diff_labels.append(age_diff)
-        else:
-            age_diff_labels.append(None)
-
-    df["AGE_GAP_OVER_20"] = age_diff_labels
+    sender_year, sender_known, sender_unk, sender_mult, _ = year_values(df[col_a])
+    addressee_year, addressee_known, addressee_unk, addressee_mult, _ = year_values(df[col_b])
+    # the difference is NaN if one of the years is missing, which is not over 20 years
+    over_20 = np.abs(sender_year - addressee_year) >= 20
+
+    df["AGE_GAP_OVER_20"] = labels([~(sender_known | addressee_known),
+                                    sender_mult & addressee_mult,
+                                    sender_unk | sender_mult | addressee_unk | addressee_mult,
+                                    over_20],
+                                   [None, "MULT", "UNK", "TRUE"],
+                                   "FALSE")
     return df
 
 def age_diff_int(df, col_a: str, col_b: str) -> pd.DataFrame:
@@ -102,22 +135,15 @@ def age_diff_int(df, col_a: str, col_b: str) -> pd.DataFrame:
         that marks the number of years of age difference between the sender and
         addressee.
     """
-    age_diff_values = []
-
-    for index, row in df.iterrows():
-        sender_year = row[col_a]
-        addressee_year = row[col_b]
-        age_diff = None
-        if pd.notna(sender_year) or pd.notna(addressee_year):
-            if sender_year in ["UNK", "MULT"] or addressee_year in ["UNK", "MULT"]:
-                pass
-            else:
-                sender_diff = abs(int(sender_year) - int(addressee_year))
-                addressee_diff = abs(int(addressee_year) - int(sender_year))
-                age_diff = int(min(sender_diff, addressee_diff))
-        age_diff_values.append(age_diff)
-
-    df["AGE_GAP"] = age_diff_values
+    sender_year = year_values(df[col_a])[0]
+    addressee_year = year_values(df[col_b])[0]
+    # the years are truncated to whole years before subtracting, as int() does
+    difference = np.abs(np.trunc(sender_year) - np.trunc(addressee_year))
+    known = ~np.isnan(difference)
+
+    age_diff_values = np.full(len(df), None, dtype=object)
+    age_diff_values[known] = difference[known].astype(int).tolist()
+    df["AGE_GAP"] = age_diff_values.tolist()
     return df
 
 def older_correspondent(df, col_a: str, col_b: str) -> pd.DataFrame:
@@ -135,40 +161,37 @@ def older_correspondent(df, col_a: str, col_b: str) -> pd.DataFrame:
         that marks the number of years of age difference between the sender and
         addressee.
     """
-    add_older_labels, sen_older_labels = [], []
-
-    for index, row in df.iterrows():
-        sender_year = row[col_a]
-        addressee_year = row[col_b]
-        if pd.notna(sender_year) and pd.notna(addressee_year):
-            if addressee_year in ["UNK"]:
-                add_older = "UNK"
-                sen_older = "UNK"
-            elif addressee_year in ["MULT"]:
-                add_older = "MULT"
-                sen_older = "MULT"
-            elif sender_year in ["UNK"]:
-                add_older = "UNK"
-                sen_older = "UNK"
-            elif sender_year in ["MULT"]:
-                add_older = "MULT"
-                sen_older = "MULT"
-            else:
-                if addressee_year <= sender_year:
-                    add_older = "TRUE"
-                    sen_older = "FALSE"
-                else:
-                    add_older = "FALSE"
-                    sen_older = "TRUE"
-            add_older_labels.append(add_older)
-            sen_older_labels.append(sen_older)
-        else:
-            add_older_labels.append(None)
-            sen_older_labels.append(None)
-
-    df["SENDER_IS_OLDER"], df["ADDRESSEE_IS_OLDER"] = sen_older_labels, add_older_labels
+    sender_year, sender_known, sender_unk, sender_mult, _ = year_values(df[col_a])
+    addressee_year, addressee_known, addressee_unk, addressee_mult, _ = year_values(df[col_b])
+    # the sentinels are checked for the addressee first, as in the original row by row version
+    conditions = [~(sender_known & addressee_known),
+                  addressee_unk,
+                  addressee_mult,
+                  sender_unk,
+                  sender_mult,
+                  addressee_year <= sender_year]
+
+    df["SENDER_IS_OLDER"] = labels(conditions, [None, "UNK", "MULT", "UNK", "MULT", "FALSE"], "TRUE")
+    df["ADDRESSEE_IS_OLDER"] = labels(conditions, [None, "UNK", "MULT", "UNK", "MULT", "TRUE"], "FALSE")
     return df
 
+def over_40(df, col_a: str, col_b: str) -> list:
+    """
+    Checks whether a correspondent was over 40 years old at the time of writing.
+    Returns "UNK" or "MULT" if the birth date is one of those sentinels,
+    and "UNK" if the year of writing is not a number.
+    """
+    letter_year, letter_known, _, _, letter_is_text = year_values(df[col_a])
+    birth_year, birth_known, birth_unk, birth_mult, _ = year_values(df[col_b])
+
+    return labels([~(letter_known & birth_known),
+                   birth_unk,
+                   birth_mult,
+                   letter_is_text,
+                   np.abs(letter_year - birth_year) >= 40],
+                  [None, "UNK", "MULT", "UNK", "TRUE"],
+                  "FALSE")
+
 def addressee_over_40(df, col_a: int, col_b: str) -> pd.DataFrame:
     """
     Calculates whether the addressee is older than 40 years.
@@ -182,29 +205,7 @@ def addressee_over_40(df, col_a: int, col_b: str) -> pd.DataFrame:
         pd.DataFrame: an updated data frame with the added column "ADDRESEE_OVER_40",
         that checks whether the addressee is over 40 years old.
     """
-    age_labels = []
-
-    for index, row in df.iterrows():
-        letter_year = row[col_a]
-        addressee_year = row[col_b]
-        if pd.notna(letter_year) and pd.notna(addressee_year):
-            if addressee_year in ["UNK"]:
-                mid_age = "UNK"
-            elif addressee_year in ["MULT"]:
-                mid_age = "MULT"
-            elif isinstance(letter_year, str):
-                mid_age = "UNK"
-            else:
-                difference = abs(letter_year - addressee_year)
-                if difference >= 40:
-                    mid_age = "TRUE"
-                else:
-                    mid_age = "FALSE"
-            age_labels.append(mid_age)
-        else:
-            age_labels.append(None)
-
-    df["ADDRESSEE_OVER_40"] = age_labels
+    df["ADDRESSEE_OVER_40"] = over_40(df, col_a, col_b)
     return df
 
 def sender_over_40(df, col_a: str, col_b: str) -> pd.DataFrame:
@@ -220,31 +221,22 @@ def sender_over_40(df, col_a: str, col_b: str) -> pd.DataFrame:
         pd.DataFrame: an updated data frame with the added column "SENDER_OVER_40",
         that checks whether the sender is over 40 years old.
     """
-    age_labels = []
-
-    for index, row in df.iterrows():
-        letter_year = row[col_a]
-        sender_year = row[col_b]
-        if pd.notna(letter_year) and pd.notna(sender_year):
-            if sender_year in ["UNK"]:
-                mid_age = "UNK"
-            elif sender_year in ["MULT"]:
-                mid_age = "MULT"
-            elif isinstance(letter_year, str):
-                mid_age = "UNK"
-            else:
-                difference = abs(letter_year - sender_year)
-                if difference >= 40:
-                    mid_age = "TRUE"
-                else:
-                    mid_age = "FALSE"
-            age_labels.append(mid_age)
-        else:
-            age_labels.append(None)
-
-    df["SENDER_OVER_40"] = age_labels
+    df["SENDER_OVER_40"] = over_40(df, col_a, col_b)
     return df
 
+def join_pair(df, col_a: str, col_b: str) -> list:
+    """
+    Joins the values of two columns as '"a", "b"', or returns None if either value is missing.
+    """
+    codes_a, uniques_a = pd.factorize(df[col_a])
+    codes_b, uniques_b = pd.factorize(df[col_b])
+    present = (codes_a != -1) & (codes_b != -1)
+    # only the distinct pairs are formatted, and mapped back onto the rows
+    pair_codes, pair_uniques = pd.factorize(np.where(present, codes_a * len(uniques_b) + codes_b, -1))
+    joined = np.array([f'"{uniques_a[code // len(uniques_b)]}", "{uniques_b[code % len(uniques_b)]}"' if code != -1 else None
+                       for code in pair_uniques], dtype=object)
+    return labels([present], [joined[pair_codes]])
+
 def genders(df, col_a: str, col_b: str) -> pd.DataFrame:
     """
     Pairs the gender of both correspondents together.
@@ -258,19 +250,7 @@ def genders(df, col_a: str, col_b: str) -> pd.DataFrame:
         pd.DataFrame: an updated data frame with the added column "GENDER_PAIR",
         that pairs the sender and addressee names together.
     """
-    genders = []
-
-    for index, row in df.iterrows():
-        gender_send = row[col_a]
-        gender_add = row[col_b]
-
-        if pd.notna(gender_send) and pd.notna(gender_add):
-            pair = f'"{gender_send}", "{gender_add}"'
-            genders.append(pair)
-        else:
-            genders.append(None)
-    
-    df["GENDER_PAIR"] = genders
+    df["GENDER_PAIR"] = join_pair(df, col_a, col_b)
     return df
 
 def pairs(df, col_a: str, col_b: str) -> pd.DataFrame:
@@ -286,19 +266,7 @@ def pairs(df, col_a: str, col_b: str) -> pd.DataFrame:
         pd.DataFrame: an updated data frame with the added column "SENDER-ADDRESSEE_PAIR",
         that pairs the sender and addressee names together.
     """
-    paired = []
-
-    for index, row in df.iterrows():
-        sender = row[col_a]
-        addressee = row[col_b]
-
-        if pd.notna(sender) and pd.notna(addressee):
-            pair = f'"{sender}", "{addressee}"'
-            paired.append(pair)
-        else:
-            paired.append(None)
-    
-    df["SENDER-ADDRESSEE_PAIR"] = paired
+    df["SENDER-ADDRESSEE_PAIR"] = join_pair(df, col_a, col_b)
     return df
 
 def apply_functions(df) -> pd.DataFrame:
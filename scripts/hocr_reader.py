@@ -0,0 +1,129 @@
+import re
+import html
+from typing import Dict, List, Tuple, Iterator
+from lxml import etree
+
+#globals
+#the opening tag of a page, block, paragraph or line, with its class, id and title
+ELEMENT = re.compile(r"""<(?:div|p|span) class=['"](ocr_\w+)['"] id=['"]([^'"]*)['"][^>]*?title=(?:'([^']*)'|"([^"]*)")""")
+#the end of the opening tag of a word, the only elements with a confidence value, and the word itself
+WORD = re.compile(r"""x_wconf (\d+)[^>]*>([^<]*)""")
+BBOX = re.compile(r"bbox (\d+) (\d+) (\d+) (\d+)")
+
+def parse_title(title: str) -> Dict[str, List[str]]:
+    """
+    Splits the "title" attribute of a .hocr element into its properties.
+    The attribute is made up of several parts separated by semicolons, e.g.
+    'bbox 226 365 635 397; baseline 0 -5; x_size 33; x_descenders 7; x_ascenders 11',
+    which results in {"bbox": ["226", "365", "635", "397"], "baseline": ["0", "-5"], ...}.
+
+    Arguments:
+        title (str): the value of the "title" attribute.
+
+    Returns:
+        Dict: the property names mapped to their values.
+    """
+    properties = {}
+    for part in title.split(";"):
+        values = part.split()
+        if values:
+            properties[values[0]] = values[1:]
+    return properties
+
+def clear_element(elem):
+    """
+    Frees an element that has been consumed, along with its preceding siblings,
+    so the parsed tree never grows beyond the current line.
+    """
+    elem.clear(keep_tail=True)
+    while elem.getprevious() is not None:
+        del elem.getparent()[0]
+
+def iter_hocr(filepath: str, words: bool = False) -> Iterator[Tuple[str, Dict]]:
+    """
+    Streams a .hocr file with lxml's iterparse, yielding the page, paragraph and line
+    elements in document order as ("page", attributes), ("paragraph", attributes)
+    and ("line", attributes) events. Elements are cleared as soon as they are consumed,
+    which keeps the memory use flat regardless of the size of the file.
+
+    Pages and paragraphs are yielded with their attributes as they appear in the file.
+    Lines additionally contain their bounding box coordinates under "bbox" and, if
+    'words' is set, the text of their words under "words" and the OCR's confidence
+    value of every word under "x_wconf". The word elements are not inspected otherwise.
+
+    Arguments:
+        filepath (str): the path to the .hocr file.
+        words (bool): whether to gather the words and confidence values of every line.
+
+    Returns:
+        Iterator[Tuple[str, Dict]]: the event names and the attributes of their elements.
+    """
+    for event, elem in etree.iterparse(filepath, events=("start", "end")):
+        hocr_class = elem.get("class")
+        if event == "start":
+            #the attributes of an element are available as soon as its tag is opened
+            if hocr_class == "ocr_page":
+                yield "page", dict(elem.attrib)
+            elif hocr_class == "ocr_par":
+                yield "paragraph", dict(elem.attrib)
+        elif hocr_class == "ocr_line":
+            attributes = dict(elem.attrib)
+            attributes["bbox"] = parse_title(elem.get("title", "")).get("bbox", [])
+            if words:
+                attributes["words"] = [word.text for word in elem]
+                attributes["x_wconf"] = [int(parse_title(word.get("title"))["x_wconf"][0]) for word in elem]
+            yield "line", attributes
+            clear_element(elem)
+        elif hocr_class in ["ocr_par", "ocr_carea"]:
+            clear_element(elem)
+
+def read_page(filepath: str) -> Dict:
+    """
+    Returns the attributes of the first page element of a .hocr file,
+    without parsing the remainder of the file.
+    """
+    for event, attributes in iter_hocr(filepath):
+        if event == "page":
+            return attributes
+    return {}
+
+def parse_page(filepath: str) -> etree._ElementTree:
+    """
+    Parses a .hocr file as a whole, for the scripts that add attributes
+    to its elements and write it back (see 'reconcile_hocr_csv').
+    """
+    return etree.parse(filepath)
+
+def scan_lines(filepath: str) -> Tuple[Dict, List[Tuple[str, List[str], List[str], List[int]]]]:
+    """
+    Reads the lines of a .hocr file as written by Tesseract, along with their words and the
+    OCR's confidence value of every word, with compiled regular expressions instead of building
+    the tree: the opening tags of the pages, blocks, paragraphs and lines are matched one by one,
+    and the words between the start of a line and the next of these tags, which belong to the line
+    as they do in 'iter_hocr', are all matched at once.
+
+    Arguments:
+        filepath (str): the path to the .hocr file.
+
+    Returns:
+        Tuple: the attributes (id and title) of the first page, and the id, bounding box
+        coordinates, words and confidence values of every line.
+    """
+    with open(filepath, encoding="UTF-8") as file:
+        text = file.read()
+
+    page, lines = {}, []
+    elements = list(ELEMENT.finditer(text))
+    for element, next_element in zip(elements, elements[1:] + [None]):
+        hocr_class, element_id = element.group(1), element.group(2)
+        title = element.group(3) if element.group(3) is not None else element.group(4)
+        if hocr_class == "ocr_line":
+            end = next_element.start() if next_element is not None else len(text)
+            matches = WORD.findall(text, element.end(), end)
+            words = [html.unescape(word) if "&" in word else word for _, word in matches]
+            bbox = BBOX.search(title)
+            lines.append((element_id, list(bbox.groups()) if bbox else [], words, [int(confidence) for confidence, _ in matches]))
+        elif hocr_class == "ocr_page" and not page:
+            page = {"id": element_id, "title": html.unescape(title)}
+
+    return page, lines
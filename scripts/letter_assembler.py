@@ -0,0 +1,209 @@
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from operator import attrgetter
+from typing import Callable, Dict, Iterable, Iterator, List
+from corpus_pages import LineRecord
+
+#globals
+#how a part is added to a field: (format if the field is still empty, format if it is not)
+SPACED = ("{}", " {}")
+APPENDED = ("{}", "{}")
+#the fields that do not hold text, set when a letter starts
+LETTER_DETAILS = ["SERIAL_NR", "PAGE", "CHAPTER", "WORDS"]
+#the words of these lines are not kept
+NO_WORDS = ["NOISE", "HEADER", "CHAPTER"]
+
+def add(parts: deque, text: str, formats: tuple = APPENDED):
+    """
+    Adds a part to a field, which is kept as a deque of strings that is only joined once the letter
+    is complete. Empty strings are never stored, so a field is empty exactly when its deque is.
+    """
+    text = formats[1 if parts else 0].format(text)
+    if text:
+        parts.append(text)
+
+def strip(parts: deque):
+    """
+    Strips the whitespace around a field, as str.strip() would on the joined field,
+    without joining it: only the parts at either end are touched.
+    """
+    while parts and not parts[0].strip():
+        parts.popleft()
+    if parts:
+        parts[0] = parts[0].lstrip()
+    while parts and not parts[-1].strip():
+        parts.pop()
+    if parts:
+        parts[-1] = parts[-1].rstrip()
+
+def add_line(parts: deque, textline: str, end: str = "\n"):
+    """
+    Adds a line to a field: the same as field = (field + textline).strip() + end.
+    """
+    add(parts, textline)
+    strip(parts)
+    add(parts, end)
+
+def add_tag(parts: deque, tag: str):
+    """
+    Adds a language tag, e.g. "[F]", to a field unless the field holds it already.
+    """
+    if tag not in "".join(parts):
+        add(parts, tag, ("{}", " & {}"))
+
+def new_letter(spec: Dict, serial_nr: int, pagenumber, chapter: str) -> OrderedDict:
+    """
+    Creates an empty letter with the fields of the spec, in order.
+    """
+    details = {"SERIAL_NR": f"{spec['serial_prefix']}{serial_nr}",
+               "PAGE": pagenumber,
+               "CHAPTER": chapter,
+               "WORDS": []
+               }
+    return OrderedDict((field, details[field] if field in LETTER_DETAILS else deque()) for field in spec["fields"])
+
+def starts_letter(spec: Dict, annotation: str, textline: str) -> bool:
+    return annotation in spec["letter_start"] and textline.startswith(spec["letter_start"][annotation])
+
+def in_text(spec: Dict, annotation: str) -> bool:
+    """
+    Whether the lines with this annotation belong to the letter's TEXT. A spec either lists the
+    annotations that do ("valid_paragraphs"), or the ones that do not ("invalid_paragraphs").
+    """
+    if "valid_paragraphs" in spec:
+        return annotation in spec["valid_paragraphs"]
+    return annotation not in spec["invalid_paragraphs"]
+
+def separate(spec: Dict, letter: OrderedDict, textline: str):
+    """
+    Separates a MULTI-annotated line, which holds the parts of two fields split by a separator symbol.
+    If the line holds several separators, the last one listed in the spec is used.
+    """
+    separator = None
+    for symbol in spec["separators"]:
+        if symbol in textline:
+            separator = symbol
+    if separator is None:
+        return
+
+    first_part, second_part = textline.split(separator, 1)
+    first_field, first_formats, second_field, second_formats, text_format = spec["separators"][separator]
+    add(letter[first_field], first_part, first_formats)
+    add(letter[second_field], second_part, second_formats)
+    if text_format:
+        add(letter["TEXT"], text_format.format(first_part, second_part))
+
+def join_fields(letter: OrderedDict) -> OrderedDict:
+    return OrderedDict((field, "".join(value) if isinstance(value, deque) else value) for field, value in letter.items())
+
+def assemble_letters(records: Iterable[LineRecord], spec: Dict) -> List[OrderedDict]:
+    """
+    Assembles the letters of a corpus from the line records of its pages, in page order.
+
+    A letter starts at a line whose annotation is a key of spec["letter_start"] and whose text starts
+    with the mapped string; that line's text is put in the field of its annotation. The other lines are
+    added to the field of their annotation, one line per row, except for MULTI-annotated lines, which
+    are split over two fields (see 'separate'), and CHAPTER lines, which set the chapter of the letters
+    that follow. The lines of the valid paragraphs are gathered under TEXT as well, with a newline
+    between paragraphs that follow each other on a page. The words of the letter's lines are gathered
+    under WORDS along with their OCR confidence values, one tuple of (word, x_wconf) pairs per line.
+
+    Arguments:
+        records (Iterable[LineRecord]): the line records of the pages, as read by 'corpus_pages'.
+        spec (Dict): describes the corpus:
+            - serial_prefix (str): the prefix of the letters' serial numbers, e.g. "j_".
+            - fields (List[str]): the fields of a letter, in order. Annotations not listed are added
+              after them, in the order in which they first occur in the letter.
+            - letter_start (Dict[str, str]): the annotations that start a letter, mapped to the string
+              their text must start with ("" for any text).
+            - valid_paragraphs or invalid_paragraphs (List[str]): the annotations that do, or do not,
+              belong to the TEXT (see 'in_text').
+            - separators (Dict[str, tuple]): the separator symbols of the MULTI-annotated lines, mapped to
+              (first field, its formats, second field, its formats, format of the text added to TEXT or None).
+            - skipped (List[str]): the annotations not added to a field of their own.
+            - inline (List[str]): the annotations whose lines are joined without newlines.
+            - language_tags (Dict[str, str]): the annotations that add a language tag to LANGUAGE.
+            - text_first (List[str]): the annotations whose lines are put ahead of the TEXT.
+
+    Returns:
+        List[OrderedDict]: the letters, with every field joined into a single string.
+    """
+    letters = []
+    # the lines ahead of the first letter are gathered in a letter that is never kept
+    letter = new_letter(spec, 0, None, "")
+    current_chapter = ""
+
+    for file_name, page_records in groupby(records, key=attrgetter("file_name")):
+        # set variables to control addition of newlines between paragraphs
+        first_line = True
+        first_paragraph = True
+
+        for paragraph_nr, paragraph_records in groupby(page_records, key=attrgetter("paragraph_nr")):
+            # to control the addition of unnecessary newlines, we must exclude
+            # paragraphs that 1) start at the top of the page (which is why we retrieve the id)
+            # and 2) paragraphs that follow annotation tags not incorporated in the dictionary
+            valid_paragraph = False
+
+            for record in paragraph_records:
+                textline = record.text
+                annotation = record.annotation
+
+                if in_text(spec, annotation):
+                    valid_paragraph = True
+
+                if starts_letter(spec, annotation, textline):
+                    letter = new_letter(spec, len(letters) + 1, record.page_number, current_chapter)
+                    add(letter[annotation], textline)
+                    letters.append(letter)
+
+                # update the chapter for every dictionary entry
+                elif annotation == "CHAPTER":
+                    current_chapter = textline
+
+                elif annotation == "MULTI":
+                    separate(spec, letter, textline)
+
+                else:
+                    if annotation in spec["language_tags"]:
+                        add_tag(letter["LANGUAGE"], spec["language_tags"][annotation])
+
+                    if annotation not in spec["skipped"]:
+                        end = "" if annotation in spec["inline"] else "\n"
+                        add_line(letter.setdefault(annotation, deque()), textline, end)
+
+                    if annotation in spec["text_first"]:
+                        letter["TEXT"].appendleft(textline.strip() + "\n")
+
+                    if in_text(spec, annotation):
+                        # add newline symbols where a new paragraph begins
+                        if not first_line and valid_paragraph and not (first_paragraph and record.paragraph_id == "par_1_1"):
+                            add(letter["TEXT"], "\n")
+                        else:
+                            first_line = False
+                            first_paragraph = False
+                        add(letter["TEXT"], textline.strip())
+
+                # keep the words of the letter's lines along with the OCR's confidence in them
+                if annotation not in NO_WORDS:
+                    letter["WORDS"].append(record.words)
+
+            if valid_paragraph:
+                add(letter["TEXT"], "\n")
+
+    return [join_fields(letter) for letter in letters]
+
+def map_letters(function: Callable, letters: List, workers: int = 1) -> Iterator:
+    """
+    Applies a function to every letter, e.g. to clean it, in a process pool if more than
+    one worker is requested, and yields the results in the order of the letters.
+    Without a pool, the letters are handled one at a time as the results are consumed.
+    """
+    if workers > 1 and len(letters) > 1:
+        chunksize = max(1, len(letters) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # executor.map returns the results in the order of the letters
+            yield from executor.map(function, letters, chunksize=chunksize)
+    else:
+        for letter in letters:
+            yield function(letter)
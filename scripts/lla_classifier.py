@@ -0,0 +1,245 @@
+import os
+import re
+import zlib
+import pickle
+import argparse
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+import lla_features
+
+#globals
+#the layout features of a line, recomputed by 'lla_features' for every dataset
+GEOMETRIC_FEATURES = ["Rel left",
+                      "Rel right",
+                      "Rel top",
+                      "Rel bottom",
+                      "Corner left",
+                      "Corner right",
+                      "Corner top",
+                      "Corner bottom",
+                      "Corner sum",
+                      "Footer dist"
+                      ]
+#the OCR's confidence in the words of a line
+CONFIDENCE_FEATURES = ["Average", "Standard deviation"]
+#the features of the neighbouring lines on the page that are added to every line
+CONTEXT_FEATURES = ["Rel left", "Rel right", "Footer dist", "Line height"]
+#the number of buckets the words of the lines are hashed into
+HASH_BUCKETS = 1024
+WORD = re.compile(r"\w+")
+
+def read_dataset(input_file: str) -> Tuple[pd.DataFrame, str]:
+    """
+    Reads a logical layout analysis dataset, as written by 'build_lla_dataset' (comma delimited)
+    or saved from Excel (semicolon delimited, with decimal commas). Every value is read as text.
+    Returns the dataset and its delimiter.
+    """
+    with open(input_file, encoding="utf-8-sig") as file:
+        header = file.readline()
+    sep = ";" if header.count(";") > header.count(",") else ","
+    df = pd.read_csv(input_file, sep=sep, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    return df, sep
+
+def number(column: pd.Series) -> np.ndarray:
+    """
+    Converts a column of text to numbers, reading decimal commas as points.
+    Empty values become 0.
+    """
+    values = pd.to_numeric(column.str.replace(",", ".", regex=False), errors="coerce")
+    return values.fillna(0).to_numpy(dtype=float)
+
+def line_texts(df: pd.DataFrame) -> pd.Series:
+    """
+    Returns the text of every line, taking the manual correction of the line where there is one.
+    """
+    texts = df["Line"]
+    if "Line correction" in df.columns:
+        texts = df["Line correction"].where(df["Line correction"] != "", texts)
+    return texts
+
+def text_features(texts: pd.Series) -> np.ndarray:
+    """
+    Describes the text of every line with a handful of values that set the letter elements apart:
+    its length, the share of capitals, digits and punctuation, and whether it opens with a bracket
+    (titles and dates), ends with a full stop or comma, or starts with a number (headers and IDs).
+    """
+    length = texts.str.len().to_numpy(dtype=float)
+    letters = texts.str.count(r"[A-Za-z]").to_numpy(dtype=float)
+    safe_length = np.maximum(length, 1)
+    return np.column_stack([np.log1p(length),
+                            np.log1p(texts.str.count(r"\S+").to_numpy(dtype=float)),
+                            texts.str.count(r"[A-Z]").to_numpy(dtype=float) / np.maximum(letters, 1),
+                            texts.str.count(r"\d").to_numpy(dtype=float) / safe_length,
+                            texts.str.count(r"[^\w\s]").to_numpy(dtype=float) / safe_length,
+                            texts.str.startswith("[").to_numpy(dtype=float),
+                            texts.str.contains(r"\]").to_numpy(dtype=float),
+                            texts.str.rstrip().str.endswith(".").to_numpy(dtype=float),
+                            texts.str.rstrip().str.endswith(",").to_numpy(dtype=float),
+                            texts.str.match(r"\s*\d").to_numpy(dtype=float),
+                            texts.str.match(r"\s*[A-Z]").to_numpy(dtype=float)
+                            ])
+
+def word_bucket(word: str) -> int:
+    """
+    Returns the bucket a word is hashed into. CRC32 is used rather than Python's own hash,
+    which changes between runs, so a saved model keeps working.
+    """
+    return zlib.crc32(word.encode("UTF-8")) % HASH_BUCKETS
+
+def word_features(texts: pd.Series) -> np.ndarray:
+    """
+    Hashes the lowercased words of every line into a fixed number of buckets, so words such as
+    "dear", "servant" or "esro" can mark the elements they belong to. The first word of a line
+    is hashed separately as well, as it is the most telling one for salutations and sign-offs.
+    """
+    matrix = np.zeros((len(texts), HASH_BUCKETS), dtype=float)
+    for row, text in enumerate(texts):
+        words = WORD.findall(text.lower())
+        for word in words:
+            matrix[row, word_bucket(word)] = 1.0
+        if words:
+            matrix[row, word_bucket(f"^{words[0]}")] = 1.0
+    return matrix
+
+def feature_matrix(df: pd.DataFrame) -> np.ndarray:
+    """
+    Builds the feature matrix of the lines of a dataset: the geometric features
+    (recomputed with 'lla_features', so the same definitions are used for training and prediction),
+    the confidence features, the text features, the hashed words, and the geometric features
+    of the previous and next line on the same page.
+    """
+    features = lla_features.add_features(df)
+    numeric = pd.DataFrame({column: number(features[column].astype(str)) for column in GEOMETRIC_FEATURES + CONFIDENCE_FEATURES})
+    page_bottom = number(features["Page bottom"].astype(str))
+    numeric["Line height"] = (number(features["Line bottom"].astype(str)) - number(features["Line top"].astype(str))) / page_bottom
+
+    pages = numeric[CONTEXT_FEATURES].groupby(features["Filename"].to_numpy(), sort=False)
+    previous_line = pages.shift(1).fillna(0).to_numpy()
+    next_line = pages.shift(-1).fillna(0).to_numpy()
+    texts = line_texts(df)
+    return np.hstack([numeric.to_numpy(), previous_line, next_line, text_features(texts), word_features(texts)])
+
+def softmax(scores: np.ndarray) -> np.ndarray:
+    """
+    Converts the scores of every line to the probabilities of the labels.
+    """
+    scores = scores - scores.max(axis=1, keepdims=True)
+    exp = np.exp(scores)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+def train(features: np.ndarray, labels: List[str], epochs: int = 300, learning_rate: float = 0.05, l2: float = 1e-4) -> Dict:
+    """
+    Trains a multinomial logistic regression on the features of the annotated lines,
+    with full-batch gradient descent (Adam) in NumPy. The features are standardised first;
+    their means and standard deviations are stored in the model and applied again when predicting.
+
+    Arguments:
+        features (np.ndarray): the feature matrix built by 'feature_matrix'.
+        labels (List[str]): the annotation of every line.
+        epochs (int): the number of passes over the lines.
+        learning_rate (float): the step size of the gradient descent.
+        l2 (float): the weight of the L2 penalty on the weights.
+
+    Returns:
+        Dict: the model, holding the labels, the standardisation and the weights.
+    """
+    classes, targets = np.unique(np.asarray(labels), return_inverse=True)
+    mean, std = features.mean(axis=0), features.std(axis=0)
+    std[std == 0] = 1.0
+    x = (features - mean) / std
+    y = np.eye(len(classes))[targets]
+
+    weights = np.zeros((x.shape[1], len(classes)))
+    bias = np.zeros(len(classes))
+    parameters = [weights, bias]
+    moments = [np.zeros_like(weights), np.zeros_like(bias)]
+    velocities = [np.zeros_like(weights), np.zeros_like(bias)]
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    for epoch in range(1, epochs + 1):
+        error = (softmax(x @ weights + bias) - y) / len(x)
+        gradients = [x.T @ error + l2 * weights, error.sum(axis=0)]
+        for parameter, gradient, moment, velocity in zip(parameters, gradients, moments, velocities):
+            moment *= beta1
+            moment += (1 - beta1) * gradient
+            velocity *= beta2
+            velocity += (1 - beta2) * gradient ** 2
+            #the parameters are updated in place, so 'weights' and 'bias' follow
+            parameter -= learning_rate * (moment / (1 - beta1 ** epoch)) / (np.sqrt(velocity / (1 - beta2 ** epoch)) + epsilon)
+
+    return {"labels": list(classes), "mean": mean, "std": std, "weights": weights, "bias": bias}
+
+def predict(model: Dict, features: np.ndarray) -> np.ndarray:
+    """
+    Returns the probability of every label (in the order of model["labels"]) for every line.
+    """
+    return softmax(((features - model["mean"]) / model["std"]) @ model["weights"] + model["bias"])
+
+def split_pages(df: pd.DataFrame, validation: float, seed: int = 0) -> np.ndarray:
+    """
+    Picks a random share of the pages to validate the classifier on. Whole pages are held out,
+    as the lines of a page share their layout. Returns a mask of the lines on the held out pages.
+    """
+    pages = df["Filename"].unique()
+    held_out = np.random.default_rng(seed).choice(pages, size=int(round(len(pages) * validation)), replace=False)
+    return df["Filename"].isin(held_out).to_numpy()
+
+def save_model(model: Dict, model_file: str):
+    os.makedirs(os.path.dirname(os.path.abspath(model_file)), exist_ok=True)
+    with open(model_file, "wb") as file:
+        pickle.dump(model, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_model(model_file: str) -> Dict:
+    with open(model_file, "rb") as file:
+        return pickle.load(file)
+
+def annotate(model: Dict, df: pd.DataFrame, threshold: float) -> pd.DataFrame:
+    """
+    Pre-annotates the lines of a dataset: adds the most probable label as "Annotation",
+    its probability as "Probability", and marks the lines whose probability falls below
+    the threshold with "REVIEW" in the "Review" column, so annotators can focus on those.
+    """
+    probabilities = predict(model, feature_matrix(df))
+    best = probabilities.argmax(axis=1)
+    df = df.copy()
+    df["Annotation"] = np.asarray(model["labels"])[best]
+    df["Probability"] = probabilities.max(axis=1).round(4)
+    df["Review"] = np.where(df["Probability"] < threshold, "REVIEW", "")
+    return df
+
+def main():
+    p = argparse.ArgumentParser(description="Train a classifier of the logical layout of the lines on annotated LLA datasets, \
+and use it to pre-annotate new LLA datasets.")
+    p.add_argument("--train_file", type=str, default=None, help="Path to an annotated LLA dataset to train the classifier on, e.g. ../logical_layout_analysis/data/annotated_lla_jeake.csv.")
+    p.add_argument("--model_file", type=str, default="../logical_layout_analysis/data/lla_classifier.pickle", help="Path to the trained classifier.")
+    p.add_argument("--validation", type=float, default=0.2, help="Share of the annotated pages held out to report the accuracy of the classifier before it is trained on all pages.")
+    p.add_argument("--input_file", type=str, default=None, help="Path to an LLA dataset to pre-annotate.")
+    p.add_argument("--output_file", type=str, default=None, help="Path to the pre-annotated .csv file. Defaults to the input file name with '_predicted' added.")
+    p.add_argument("--threshold", type=float, default=0.9, help="Lines predicted with a lower probability are marked for review.")
+    args = p.parse_args()
+
+    if args.train_file:
+        df, _ = read_dataset(args.train_file)
+        df = df[df["Annotation"] != ""].reset_index(drop=True)
+        features, labels = feature_matrix(df), df["Annotation"].to_numpy()
+        if args.validation > 0:
+            held_out = split_pages(df, args.validation)
+            model = train(features[~held_out], labels[~held_out])
+            probabilities = predict(model, features[held_out])
+            predicted = np.asarray(model["labels"])[probabilities.argmax(axis=1)]
+            sure = probabilities.max(axis=1) >= args.threshold
+            print(f"Accuracy on {held_out.sum()} held out lines: {(predicted == labels[held_out]).mean():.3f}. "
+                  f"{(~sure).mean():.1%} of the lines would be marked for review; "
+                  f"the accuracy on the others is {(predicted[sure] == labels[held_out][sure]).mean():.3f}.")
+        save_model(train(features, labels), args.model_file)
+        print(f"Classifier trained on {len(df)} lines written to {args.model_file}.")
+
+    if args.input_file:
+        df, sep = read_dataset(args.input_file)
+        annotated = annotate(load_model(args.model_file), df, args.threshold)
+        output_file = args.output_file or f"{os.path.splitext(args.input_file)[0]}_predicted.csv"
+        annotated.to_csv(output_file, sep=sep, index=False, encoding="UTF-8")
+        print(f"{(annotated['Review'] != '').sum()} of {len(annotated)} lines marked for review in {output_file}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import re
+import argparse
+import numpy as np
+import pandas as pd
+from typing import Iterable
+
+#globals
+#the columns added to the logical layout analysis dataset, in order
+FEATURE_COLUMNS = ["Prev line dist",
+                   "Rel left",
+                   "Rel right",
+                   "Rel top",
+                   "Rel bottom",
+                   "Corner left",
+                   "Corner right",
+                   "Corner top",
+                   "Corner bottom",
+                   "Corner sum",
+                   "Footer dist"
+                   ]
+#the running headers of every edition, against whose positions the notebook measured the corner distances
+HEADER_PATTERNS = ["The Marescoe-David Letters",
+                   "The Jeake Family"
+                   ]
+#the page dimension each line coordinate is divided by
+RELATIVE_TO = {"left": "Page right",
+               "right": "Page right",
+               "top": "Page bottom",
+               "bottom": "Page bottom"
+               }
+
+def numeric(df: pd.DataFrame, column: str) -> np.ndarray:
+    """
+    Returns a column of coordinates as a float array, whether it was read as numbers or as text.
+    """
+    return pd.to_numeric(df[column]).to_numpy(dtype=float)
+
+def previous_line_distance(df: pd.DataFrame) -> np.ndarray:
+    """
+    Returns the previous line distance of every line: the bottom coordinate of the
+    preceding line on the same page, if the current line ends below it, and 0 otherwise
+    (for the first line of a page, or where the reading order moves back up the page).
+    The preceding lines are found with a single grouped shift over the pages.
+    """
+    bottom = numeric(df, "Line bottom")
+    previous = pd.Series(bottom, index=df.index).groupby(df["Filename"], sort=False).shift().to_numpy()
+    #the coordinates are whole pixels
+    return np.where(bottom > previous, previous, 0).astype(np.int64)
+
+def corner_distance(relative: np.ndarray, mean: float, std: float) -> np.ndarray:
+    """
+    Returns how far the relative distances lie outside of two standard deviations of the mean:
+    the distance above the upper bound, or below the lower bound, as a positive value,
+    and 0 for the distances in between.
+    """
+    upper, lower = mean + 2 * std, mean - 2 * std
+    return np.maximum(relative - upper, 0) + np.maximum(lower - relative, 0)
+
+def add_features(df: pd.DataFrame, header_pattern: str = None) -> pd.DataFrame:
+    """
+    Adds the geometric features used to annotate the logical layout of the pages
+    to a dataset built by 'build_lla_dataset', computed from the bounding boxes of the
+    pages and lines for all lines at once:
+
+    - Prev line dist: see 'previous_line_distance'.
+    - Rel left/right/top/bottom: the line's coordinates relative to the page width or height.
+    - Corner left/right/top/bottom: how far the relative coordinates stray from those of the
+      reference lines (see 'corner_distance'), and Corner sum, the sum of all four.
+    - Footer dist: the gap between the line and the preceding line, relative to the page height.
+
+    Arguments:
+        df (pd.DataFrame): the dataset, with the lines of every page in reading order.
+        header_pattern (str): a regular expression matching the running headers, e.g. "The Marescoe-David Letters".
+            The corner distances are measured against the positions of these lines. By default, all lines are used.
+
+    Returns:
+        pd.DataFrame: the dataset with the feature columns added, or updated if they were present.
+    """
+    df = df.copy()
+    df["Prev line dist"] = previous_line_distance(df)
+
+    for side, page_side in RELATIVE_TO.items():
+        df[f"Rel {side}"] = numeric(df, f"Line {side}") / numeric(df, page_side)
+
+    reference = np.ones(len(df), dtype=bool)
+    if header_pattern:
+        reference = df["Line"].astype(str).str.contains(header_pattern, regex=True).to_numpy()
+        if not reference.any():
+            raise ValueError(f"Error: no lines match the header pattern '{header_pattern}'. Pass the running headers of this edition, or an empty pattern to use all lines.")
+
+    for side in RELATIVE_TO:
+        relative = df[f"Rel {side}"].to_numpy()
+        #the sample standard deviation, as computed by pandas
+        std = relative[reference].std(ddof=1) if reference.sum() > 1 else 0.0
+        df[f"Corner {side}"] = corner_distance(relative, relative[reference].mean(), std)
+    df["Corner sum"] = df[[f"Corner {side}" for side in RELATIVE_TO]].sum(axis=1)
+
+    df["Footer dist"] = df["Rel top"] - df["Prev line dist"] / numeric(df, "Page bottom")
+    return df
+
+def find_header_pattern(lines: Iterable[str], header_pattern: str = None) -> str:
+    """
+    Returns the pattern of the running headers to measure the corner distances against.
+    Without a pattern, the first of HEADER_PATTERNS that matches any of the lines is used,
+    i.e. the headers of the edition the pages come from, or all lines if none of them match.
+    A given pattern must match at least one line; an empty one stands for all lines.
+
+    Arguments:
+        lines (Iterable[str]): the text of the lines of the dataset.
+        header_pattern (str): a regular expression matching the running headers, or None.
+
+    Returns:
+        str: the pattern, or "" to measure against all lines.
+    """
+    lines = list(lines)
+    if header_pattern is None:
+        for pattern in HEADER_PATTERNS:
+            if any(re.search(pattern, line) for line in lines):
+                return pattern
+        return ""
+    if header_pattern:
+        try:
+            regex = re.compile(header_pattern)
+        except re.error as e:
+            raise ValueError(f"Invalid header pattern '{header_pattern}': {e}.")
+        if not any(regex.search(line) for line in lines):
+            raise ValueError(f"No lines match the header pattern '{header_pattern}'. Pass the running headers of this edition, or an empty pattern to use all lines.")
+    return header_pattern
+
+def add_features_to_csv(input_file: str, output_file: str = None, header_pattern: str = None, sep: str = ","):
+    """
+    Adds the features (see 'add_features') to a dataset saved as a .csv file.
+    Every value is read as text, so the columns that are not recomputed are written back as they were.
+    The dataset is overwritten unless an output file is given. Without a header pattern,
+    the running headers are found with 'find_header_pattern'.
+    Returns the number of lines in the dataset.
+    """
+    df = pd.read_csv(input_file, sep=sep, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    header_pattern = find_header_pattern(df["Line"], header_pattern)
+    add_features(df, header_pattern).to_csv(output_file or input_file, sep=sep, index=False, encoding="UTF-8")
+    return len(df)
+
+def main():
+    p = argparse.ArgumentParser(description="Add the geometric features for logical layout analysis to a dataset built by build_lla_dataset.")
+    p.add_argument("input_file", type=str, help="Path to the .csv dataset.")
+    p.add_argument("--output_file", type=str, default=None, help="Path to the output .csv file. Defaults to overwriting the input file.")
+    p.add_argument("--sep", type=str, default=",", help="The delimiter of the .csv files.")
+    p.add_argument("--header_pattern", type=str, default=None, help="Regular expression matching the running headers, against which the corner distances are measured. Defaults to the headers of the edition the pages come from (HEADER_PATTERNS), as in the notebook, or all lines if none match; an empty pattern measures against all lines.")
+    args = p.parse_args()
+
+    try:
+        n_lines = add_features_to_csv(args.input_file, args.output_file, args.header_pattern, args.sep)
+    except ValueError as e:
+        p.error(str(e))
+    print(f"Features for {n_lines} lines written to {args.output_file or args.input_file}.")
+
+if __name__ == "__main__":
+    main()
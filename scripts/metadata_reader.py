@@ -0,0 +1,104 @@
+import os
+import csv
+from typing import Dict, List
+import pandas as pd
+import build_cache
+
+#globals
+#every field of a letter's metadata record: the columns it may be read from, in order of preference, and its type
+SCHEMA = [("sender", ["SENDER_CLEANED"], str),
+          ("addressee", ["ADDRESSEE_CLEANED"], str),
+          ("sender-addressee_pair", ["SENDER-ADDRESSEE_PAIR"], str),
+          ("date", ["DATE_OF_WRITING", "DATE"], str),
+          ("year", ["YEAR"], int),
+          ("language", ["LANGUAGE"], str),
+          ("gender_sender", ["GENDER_SENDER"], str),
+          ("gender_addressee", ["GENDER_ADDRESSEE"], str),
+          ("gender_pair", ["GENDER_PAIR"], str),
+          ("connection_type", ["CONNECTION_TYPE"], str),
+          ("generation_sender", ["SENDER_GENERATION"], str),
+          ("generation_addressee", ["ADDRESSEE_GENERATION"], str),
+          ("sender_is_older", ["SENDER_IS_OLDER"], str),
+          ("sender_over_40", ["SENDER_OVER_40"], str),
+          ("addressee_over_40", ["ADDRESSEE_OVER_40"], str),
+          ("age_gap", ["AGE_GAP"], int),
+          ("age_gap_over_20", ["AGE_GAP_OVER_20"], str)
+          ]
+KEY_COLUMN = "SERIAL_NR"
+
+def read_table(metadata_file: str) -> pd.DataFrame:
+    """
+    Reads a metadata sheet: an .xlsx file, a .csv file, or a tab delimited .txt file
+    as written by 'metadata_to_txt', in which missing values are written as "nan".
+    """
+    extension = os.path.splitext(metadata_file)[1].lower()
+    if extension in [".xlsx", ".xls"]:
+        return pd.read_excel(metadata_file)
+    if extension == ".csv":
+        return pd.read_csv(metadata_file)
+    return pd.read_csv(metadata_file, sep="\t", dtype=str, keep_default_na=False, na_values=["nan"], quoting=csv.QUOTE_NONE, encoding="UTF-8")
+
+def find_column(table: pd.DataFrame, field: str, candidates: List[str]) -> str:
+    """
+    Returns the first of the candidate columns that is present in the metadata sheet.
+    Raises a ValueError naming the field if none of them are.
+    """
+    for column in candidates:
+        if column in table.columns:
+            return column
+    raise ValueError(f"Error: the metadata has no column for '{field}'. Expected one of {', '.join(candidates)}.")
+
+def column_values(column: pd.Series, kind: type) -> List:
+    """
+    Converts a column of the metadata sheet to the values of a field. Missing values become
+    empty strings. Text is cleaned as 'metadata_to_txt' does; numbers are cast to integers.
+    """
+    present = column.notna() & column.astype(object).ne("nan")
+    if kind is int:
+        # markers such as "[undated]" in place of a number count as missing values
+        numbers = pd.to_numeric(column.where(present), errors="coerce")
+        present = present & numbers.notna()
+        return [int(number) if keep else "" for number, keep in zip(numbers, present)]
+    text = column.astype(object).map(lambda value: str(value).replace("\n", " ").strip())
+    return [value if keep else "" for value, keep in zip(text, present)]
+
+def parse_metadata(table: pd.DataFrame) -> Dict[str, Dict]:
+    """
+    Converts a metadata sheet to records holding the fields in 'SCHEMA', looked up by name.
+    The columns are converted once each, and then joined into one record per letter.
+
+    Arguments:
+        table (pd.DataFrame): the metadata sheet.
+
+    Returns:
+        Dict[str, Dict]: the serial numbers of the letters mapped to their records.
+    """
+    if KEY_COLUMN not in table.columns:
+        raise ValueError(f"Error: the metadata has no '{KEY_COLUMN}' column.")
+    keys = column_values(table[KEY_COLUMN], str)
+    fields = [field for field, _, _ in SCHEMA]
+    columns = [column_values(table[find_column(table, field, candidates)], kind) for field, candidates, kind in SCHEMA]
+    return {key: dict(zip(fields, values)) for key, *values in zip(keys, *columns)}
+
+def load_metadata(metadata_file: str, cache_dir: str = None) -> Dict[str, Dict]:
+    """
+    Loads the metadata of a corpus as a dictionary, which gives the record of a letter by its serial number.
+    With a cache folder, the parsed metadata is stored along with a hash of the metadata file,
+    and the file is only parsed again once it changes.
+
+    Arguments:
+        metadata_file (str): path to the .xlsx, .csv or .txt metadata file.
+        cache_dir (str): the folder holding the build cache, or None to parse the file every time.
+
+    Returns:
+        Dict[str, Dict]: the serial numbers of the letters mapped to their records.
+    """
+    cache_name = os.path.splitext(os.path.basename(metadata_file))[0]
+    digest = build_cache.text_digest(build_cache.file_digest(metadata_file), build_cache.file_digest(__file__))
+    cache = build_cache.load_cache(cache_dir, cache_name)
+    if digest in cache:
+        return cache[digest]
+
+    metadata = parse_metadata(read_table(metadata_file))
+    build_cache.save_cache(cache_dir, cache_name, {digest: metadata})
+    return metadata
@@ -1,21 +1,21 @@
 import difflib
 from difflib import SequenceMatcher
 import os.path
-from lxml import etree
 import json
 import csv
 import numpy as np
 import pandas as pd
 from collections import Counter
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import alignment
+import utils
+import confusion_store
 
 def open_files(file):
     with open(file, encoding='UTF-8') as stream:
-        r = stream.read()
-        #change long dashes into short ones
-        r = r.replace("—", "-")
-        #change stylised hyphens into regular ones
-        r = r.replace("‘", "'").replace("’", "'").replace("“", "'").replace("”", "'")
+        #normalise the dashes, quotes and symbols the same way as the corpora
+        r = utils.normalise(stream.read(), nfc=True)
 
     s_chars = r
     s_words = r.split()
@@ -59,55 +59,104 @@ def generate_report(file_a, file_b, filename, label):
 
     return comparison
 
-def pair_difference(comparison):
-
-    """
-    This function extracts the contents from the comparison report
-    and pairs the differences in a list.
-    """
-
-    comparison = comparison.replace("&nbsp;"," ")
-    root = etree.fromstring(comparison)
-
-    table = root.findall(".//table")[0]
-
-    pairs = []
-    for row in table.findall(".//tr"):
-        cells = row.findall(".//td")
-        gold_cell = cells[2]
-        if len(gold_cell.getchildren())>0:
-            gold = gold_cell[0].text
-        else:
-            gold = gold_cell.text
-        predicted_cell = cells[5]
-        if len(predicted_cell.getchildren())>0:
-            predicted = predicted_cell[0].text
-        else:
-            predicted = predicted_cell.text
-        pairs.append((gold, predicted))
-        
-    return pairs
-
 def seq_ratio(file_a, file_b):
     
     """
     Returns a score number representing how close two files match each other.
     The function takes two arguments, one for each file you wish to compare.
+
+    The score relies on difflib's heuristics, which skip frequent characters on long pages;
+    see 'alignment.error_rate' for the exact character and word error rates.
     """
 
     seq = SequenceMatcher(a=file_a, b=file_b)
     return seq.ratio()
 
-def update_d(d, previous, current):
-    if previous not in d: #if the previous key is not in the dictionary
-        d[previous] = {} #make a nested dictionary for that key
-    if current in d[previous]: #if the current key is in the previous dictionary
-        d[previous][current] += 1 #increment value of current key
+def evaluate_page(task):
+
+    """
+    Compares the Abbyy and Tesseract output of a single page to its gold standard.
+
+    The task is a tuple of the collection, the file name, and whether the
+    confusion pairs ('errors') and the .html comparison reports ('reports')
+    should be made. Returns the file name, its scores and its confusion pairs,
+    or None if the page has no gold standard.
+    """
+
+    collection, f, errors, reports = task
+    current_errors = {}
+    current_errors["file"] = f
+    current_errors["collection"] = collection
+    labels = ["_characters", "_words", "_lines"]
+    output_path_gold = "../ocr_analysis/gold_standard/%s/gs_%s.txt" %(collection, f)
+    output_path_abby = "../ocr_output/txt_%s_abbyy/abb_%s.txt" %(collection, f)
+    output_path_tess = "../ocr_output/txt_%s_tesseract/%s.txt" %(collection, f)
+    if not os.path.exists(output_path_gold):
+        print(f"Gold standard file not found: {output_path_gold}")
+        return None
+
+    # Open and separate the gold standard using the OPENING AND SPLIT functions.
+    (gold_chars,gold_words,gold_lines) = open_files(output_path_gold)
+
+    # Open and separate the Abby files using the OPENING AND SPLIT FILES functions.
+    (abby_chars,abby_words,abby_lines) = open_files(output_path_abby)
+
+    # Create sequence ratios for every split level using the SEQUENCE MATCHING function.
+    current_errors["abby_ratio_chars"] = seq_ratio(abby_chars, gold_chars)
+    current_errors["abby_ratio_words"] = seq_ratio(abby_words, gold_words)
+    current_errors["abby_ratio_lines"] = seq_ratio(abby_lines, gold_lines)
+
+    # Create the character and word error rates using the ALIGNMENT module.
+    current_errors["abby_cer"] = alignment.error_rate(abby_chars, gold_chars)
+    current_errors["abby_wer"] = alignment.error_rate(abby_words, gold_words)
+    
+    # Open and separate the Tesseract files using the OPENING AND SPLIT FILES functions.
+    (tess_chars,tess_words,tess_lines) = open_files(output_path_tess)
+
+    # Create sequence ratios for every split level using the SEQUENCE MATCHING function.
+    current_errors["tess_ratio_chars"] = seq_ratio(tess_chars, gold_chars)
+    current_errors["tess_ratio_words"] = seq_ratio(tess_words, gold_words)
+    current_errors["tess_ratio_lines"] = seq_ratio(tess_lines, gold_lines)
+
+    # Create the character and word error rates using the ALIGNMENT module.
+    current_errors["tess_cer"] = alignment.error_rate(tess_chars, gold_chars)
+    current_errors["tess_wer"] = alignment.error_rate(tess_words, gold_words)
+
+    confusions = []
+    if errors:
+        confusions.extend(page_confusions(collection, f, "abbyy", gold_chars, abby_chars))
+        confusions.extend(page_confusions(collection, f, "tesseract", gold_chars, tess_chars))
+        confusions.extend(page_confusions(collection, f, "abbyy", gold_words, abby_words, "words"))
+        confusions.extend(page_confusions(collection, f, "tesseract", gold_words, tess_words, "words"))
+
+    # Generate comparison reports:
+    if reports:
+        generate_report(abby_chars, gold_chars, "%s_"%collection+f+"_abbyy", labels[0])
+        generate_report(abby_words, gold_words, "%s_"%collection+f+"_abbyy", labels[1])
+        generate_report(abby_lines, gold_lines, "%s_"%collection+f+"_abbyy", labels[2])
+        generate_report(tess_chars, gold_chars, "%s_"%collection+f+"_tesseract", labels[0])
+        generate_report(tess_words, gold_words, "%s_"%collection+f+"_tesseract", labels[1])
+        generate_report(tess_lines, gold_lines, "%s_"%collection+f+"_tesseract", labels[2])
+
+    return (f, current_errors, confusions)
+
+def evaluate_pages(tasks, workers=1):
+
+    """
+    Evaluates the pages with 'evaluate_page', in a process pool if more than one
+    worker is requested, and yields the results in the order of the tasks.
+    """
+
+    if workers > 1 and len(tasks) > 1:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # executor.map returns the results in the order of the tasks
+            yield from executor.map(evaluate_page, tasks, chunksize=chunksize)
     else:
-        d[previous][current] = 1 #otherwise, set value of current key to one
-    return d
+        for task in tasks:
+            yield evaluate_page(task)
 
-def separate_collection(collection, files_with_errors):
+def separate_collection(collection, files_with_errors, confusions=None, reports=False, workers=1):
 
     """
     separate files from different collections
@@ -118,6 +167,8 @@ def separate_collection(collection, files_with_errors):
     - Collection chooses from which
     collection the input/output is compared (Jeake or Marescoe, or
     any other collection that might be added in the future).
+    A list of collections can be passed as well, in which case the
+    pages of all collections are evaluated together.
     - Files_with_errors can be used to either summon a dictionary of
     all of the sequence matching results from all files across all
     collections (use '{}' as argument),
@@ -125,109 +176,115 @@ def separate_collection(collection, files_with_errors):
     sequence matching scores of that file. This argument can also
     be used stand-alone, outside of the function to call the
     nested dictionary.
+
+    If a list is passed as 'confusions', the confusion pairs of the
+    characters and words of every page are added to it (see 'page_confusions').
+    The .html comparison reports are only rendered if 'reports' is set.
+    With more than one worker, the pages are evaluated in a process pool;
+    the results are still merged by collection and file name.
     """
 
-    files = os.listdir("../ocr_analysis/gold_standard/%s"%collection)
-    #print(files)
-    files = [f[3:-4] for f in files if f[-4:] == ".txt"]
-    for f in files:
-        current_errors = {}
-        current_errors["file"] = f
-        current_errors["collection"] = collection
-        labels = ["_characters", "_words", "_lines"]
-        output_path_gold = "../ocr_analysis/gold_standard/%s/gs_%s.txt" %(collection, f)
-        output_path_abby = "../ocr_output/txt_%s_abbyy/abb_%s.txt" %(collection, f)
-        output_path_tess = "../ocr_output/txt_%s_tesseract/%s.txt" %(collection, f)
-        if not os.path.exists(output_path_gold):
-            print(f"Gold standard file not found: {output_path_gold}")
+    collections = [collection] if isinstance(collection, str) else collection
+    tasks = []
+    for collection in collections:
+        files = sorted(os.listdir("../ocr_analysis/gold_standard/%s"%collection))
+        files = [f[3:-4] for f in files if f[-4:] == ".txt"]
+        tasks.extend((collection, f, confusions is not None, reports) for f in files)
+
+    for result in evaluate_pages(tasks, workers):
+        if result is None:
             continue
+        f, current_errors, page_confusion = result
+        files_with_errors[f] = current_errors
+        if confusions is not None:
+            confusions.extend(page_confusion)
 
-        # Open and separate the gold standard using the OPENING AND SPLIT functions.
-        (gold_chars,gold_words,gold_lines) = open_files(output_path_gold)
+    return files_with_errors
 
-        # Open and separate the Abby files using the OPENING AND SPLIT FILES functions.
-        (abby_chars,abby_words,abby_lines) = open_files(output_path_abby)
+def page_confusions(collection, f, engine, gold, predicted, level="characters"):
 
-        # Create sequence ratios for every split level using the SEQUENCE MATCHING function.
-        current_errors["abby_ratio_chars"] = seq_ratio(abby_chars, gold_chars)
-        current_errors["abby_ratio_words"] = seq_ratio(abby_words, gold_words)
-        current_errors["abby_ratio_lines"] = seq_ratio(abby_lines, gold_lines)
-        
-        # Open and separate the Tesseract files using the OPENING AND SPLIT FILES functions.
-        (tess_chars,tess_words,tess_lines) = open_files(output_path_tess)
+    """
+    Pairs the characters (or words, with level="words") of the gold standard with the ones
+    the OCR engine read in their place, along the alignment of both files, and counts every pair.
+    Characters the OCR engine left out are paired with None, as are characters it added.
+    Returns one record per pair, in the order in which the pairs first occur on the page.
+    """
 
-        # Create sequence ratios for every split level using the SEQUENCE MATCHING function.
-        current_errors["tess_ratio_chars"] = seq_ratio(tess_chars, gold_chars)
-        current_errors["tess_ratio_words"] = seq_ratio(tess_words, gold_words)
-        current_errors["tess_ratio_lines"] = seq_ratio(tess_lines, gold_lines)
+    counts = Counter(alignment.aligned_pairs(gold, predicted))
+    return [{"level": level,
+             "collection": collection,
+             "file": f,
+             "engine": engine,
+             "gold": gold_char,
+             "predicted": predicted_char,
+             "count": count
+             } for (gold_char, predicted_char), count in counts.items()]
 
-        files_with_errors[f] = current_errors
+def write_confusions(confusions, outpath):
 
-        # Generate comparison reports:
-        generate_report(abby_chars, gold_chars, "%s_"%collection+f+"_abbyy", labels[0])
-        generate_report(abby_words, gold_words, "%s_"%collection+f+"_abbyy", labels[1])
-        generate_report(abby_lines, gold_lines, "%s_"%collection+f+"_abbyy", labels[2])
-        generate_report(tess_chars, tess_chars, "%s_"%collection+f+"_tesseract", labels[0])
-        generate_report(tess_words, tess_words, "%s_"%collection+f+"_tesseract", labels[1])
-        generate_report(tess_lines, tess_lines, "%s_"%collection+f+"_tesseract", labels[2])
-
-    return files_with_errors
+    """
+    Merges the confusion pairs of the evaluated pages into the corpus-wide confusion store,
+    'confusion_pairs.jsonl', which keeps the pairs of the pages evaluated in earlier runs
+    (see 'confusion_store'). For every page, the character pairs are also written as a nested
+    dictionary of gold characters, mapped to the characters read in their place and their counts.
+    """
 
-def create_char_diff(path, outpath):
     os.makedirs(outpath, exist_ok=True)
-    d = {}
-    files = os.listdir(path)
-
-    for filename in files:
-        if filename.endswith("characters.html"):
-            file_path = os.path.join(path, filename)
-            with open(file_path, "r", encoding="utf-8") as html_file:
-                comparison_content = html_file.read()
+    store_file = os.path.join(outpath, "confusion_pairs.jsonl")
+    store = confusion_store.merge(confusion_store.load_store(store_file), confusions)
+    confusion_store.save_store(store, store_file)
 
-            print(f"Processing {filename}...")
-            differences = pair_difference(comparison_content)
-            diff_dict = {}
-            for item in differences:
-                diff_dict = update_d(diff_dict, item[0], item[1])
+    pages = {}
+    for record in confusions:
+        if record["level"] != "characters":
+            continue
+        page = "%s_%s_%s_characters" %(record["collection"], record["file"], record["engine"])
+        pages.setdefault(page, {}).setdefault(record["gold"], {})[record["predicted"]] = record["count"]
 
-            json_output_path = os.path.join(outpath, f"{filename[:-5]}.json")
-            with open(json_output_path, "w", encoding="utf-8") as outfile:
-                json.dump(diff_dict, outfile, indent=2)          
+    for page, diff_dict in pages.items():
+        json_output_path = os.path.join(outpath, f"{page}.json")
+        with open(json_output_path, "w", encoding="utf-8") as outfile:
+            json.dump(diff_dict, outfile, indent=2)
 
 def main():
     p = argparse.ArgumentParser(description="Analyse the OCR output.")
     p.add_argument("--output_dir", default="../ocr_analysis", help="Specify the output directory for the script.")
-    p.add_argument("--collections", default=["jeake", "marescoe-david"], help="Specify the collection you wish to analyse.")
-    p.add_argument("--errors", action="store_true", help="Create .json files to examine what words and characters the OCR swapped.")
+    p.add_argument("--collections", nargs="+", default=["jeake", "marescoe-david"], help="Specify the collection(s) you wish to analyse.")
+    p.add_argument("--errors", action="store_true", help="Add the words and characters the OCR swapped to the confusion store, and create .json files to examine them.")
+    p.add_argument("--reports", action="store_true", help="Render .html comparison reports of the characters, words and lines of every page.")
+    p.add_argument("--workers", type=int, default=1, help="Number of processes used to evaluate the pages.")
     args = p.parse_args()
 
     files_with_errors = {}
-    for collection in args.collections:
-        print(f"Building comparison reports for {collection} collection.")
-        try:
-            files_with_errors = separate_collection(collection, files_with_errors)
-        except Exception as e:
-            print(f"Error building comparison reports for {collection} collection: {e}")
-    print(f"Comparison reports written to {args.output_dir}.")
+    confusions = [] if args.errors else None
+    # the pages of all collections share the process pool
+    print(f"Comparing the OCR output of the {', '.join(args.collections)} collection(s).")
+    try:
+        files_with_errors = separate_collection(args.collections, files_with_errors, confusions, args.reports, args.workers)
+    except Exception as e:
+        print(f"Error comparing the OCR output: {e}")
+    if args.reports:
+        print(f"Comparison reports written to {args.output_dir}.")
     for f, results in files_with_errors.items():
         print(f"Error ratio for file {f}: {results.values()}.")
 
-    csv_output = os.path.join(args.output_dir, "error_ratios.csv")
-    with open(csv_output, "w", newline="") as csvfile:
-        field_names=results.keys()
-        val = results.values()
-        csv_writer = csv.DictWriter(csvfile, dialect="excel", fieldnames=field_names)
-        csv_writer.writeheader()
-        for f, results in files_with_errors.items():
-            csv_writer.writerow(results)
-        print(f"File 'error_ratios.csv' written to {args.output_dir}.")
+    os.makedirs(args.output_dir, exist_ok=True)
+    if files_with_errors:
+        csv_output = os.path.join(args.output_dir, "error_ratios.csv")
+        with open(csv_output, "w", newline="") as csvfile:
+            # every page has the same fields, so they are taken from the first one
+            field_names = next(iter(files_with_errors.values())).keys()
+            csv_writer = csv.DictWriter(csvfile, dialect="excel", fieldnames=field_names)
+            csv_writer.writeheader()
+            for f, results in files_with_errors.items():
+                csv_writer.writerow(results)
+            print(f"File 'error_ratios.csv' written to {args.output_dir}.")
+    else:
+        print("No pages were evaluated, so no 'error_ratios.csv' was written.")
     
     if args.errors:
         output_path_chars = os.path.join(args.output_dir, "error_analysis_chars")
-        create_char_diff(
-            path=os.path.join(args.output_dir, "compare_chars"),
-            outpath=output_path_chars
-        )
+        write_confusions(confusions, output_path_chars)
         print(f"Error analysis for OCR characters created in {output_path_chars}.")
 
 if __name__ == "__main__":
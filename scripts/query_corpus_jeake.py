@@ -1,6 +1,8 @@
 import os
-import json
 import argparse
+import corpus_index
+import metadata_reader
+import query_dataset
 
 #globals
 WINDOW_SIZE = 30
@@ -10,49 +12,16 @@ QUERIES = ["god",
 		   "almighty"
 		   ]
 
-def read_metadata(metadata_file):
-	metalines = open(metadata_file, "r", encoding="UTF-8").readlines()
-	metadic = {}
-	for line in metalines[1:]:
-		line = line.strip().split("\t")
-		id = line[0]
-		record = {"sender": line[19] if line[19] != "nan" else "",
-            "addressee": line[20] if line[20] != "nan" else "",
-            "sender-addressee_pair": line[34] if line[34] != "nan" else "",
-            "date": line[8] if line[8] != "nan" else "",
-            "year": int(float(line[18])) if line[18] != "nan" else "",
-            "language": line[13] if line[13] != "nan" else "",
-			"gender_sender": line[21] if line [21] != "nan" else "",
-			"gender_addressee": line[22] if line [22] != "nan" else "",
-            "gender_pair": line[35] if line[35] != "nan" else "",
-            "connection_type": line[27] if line[27] != "nan" else "",
-            "generation_sender": line[24] if line[24] != "nan" else "",
-            "generation_addressee": line[26] if line[26] != "nan" else "",
-            "sender_is_older": line[28] if line[28] != "nan" else "",
-            "sender_over_40": line[30] if line[30] != "nan" else "",
-			"addressee_over_40": line[31] if line[31] != "nan" else "",
-			"age_gap": int(float(line[32])) if line[32] != "nan" else "",
-            "age_gap_over_20": line[33] if line[33] != "nan" else ""
-		}
-		metadic[id] = record
-
-	return metadic
-
-
-def tokenize(text):
-    lines = text.split("\n")
-    tokens = []
-    for line in lines:
-        unhidden_tokens = [token for token in line.split(" ") if len(token) > 0]
-        tokens.extend(unhidden_tokens)
-        
-    return tokens
-
 if __name__ == "__main__":
 	p = argparse.ArgumentParser(description="Query the corpus for instances referring to the divine. Optimised to work with the Jeake corpus.")
-	p.add_argument("--input_file", type=str, default="../corpus/corpus_jeake.json", help="Path to the corpus .json file.")
-	p.add_argument("--metadata_file", type=str, default="../metadata/metadata_jeake.txt", help="Path to the .txt metadata file.")
+	p.add_argument("--input_file", type=str, default="../corpus/corpus_jeake.json", help="Path to the corpus .json, .jsonl(.gz) or .parquet file.")
+	p.add_argument("--metadata_file", type=str, default="../metadata/metadata_jeake_v3.xlsx", help="Path to the .xlsx, .csv or .txt metadata file.")
 	p.add_argument("--output_file", type=str, default="dataset_jeake.txt", help="Name of the output file.")
+	p.add_argument("--index_file", type=str, default="../.build_cache/index_jeake.pickle", help="Path to the inverted index of the corpus. It is built if it does not exist or the corpus changed.")
+	p.add_argument("--queries", nargs="+", default=QUERIES, help="Terms to query the corpus for. Defaults to the divine references in QUERIES.")
+	p.add_argument("--mode", type=str, default="substring", choices=["substring", "prefix", "exact"], help="Whether tokens must contain, start with, or equal a query.")
+	p.add_argument("--parquet", action="store_true", help="Also save the dataset as a .parquet table, with numeric YEAR, PAGE, LENGTH and REL_TOKEN_POS columns, for the statistics notebooks. Requires pyarrow.")
+	p.add_argument("--cache_dir", type=str, default="../.build_cache", help="Path to the build cache folder, in which the parsed metadata is kept until the metadata file changes.")
 	args = p.parse_args()
 
 	input_file = args.input_file
@@ -64,89 +33,21 @@ if __name__ == "__main__":
 	
 	output_path = os.path.join(output_dir, output_file)
 
-	meta = read_metadata(metadata_file)
-	open_file = open(output_path, "w", encoding="UTF-8")
-	open_file.write("NR\t\
-SENDER\t\
-ADDRESSEE\t\
-SENDER-ADDRESSEE_PAIRS\t\
-DATE\t\
-YEAR\t\
-LANGUAGE\t\
-GENDER_SENDER\t\
-GENDER_ADDRESSEE\t\
-GENDER_PAIR\t\
-CONNECTION_TYPE\t\
-GENERATION_SENDER\t\
-GENERATION_ADDRESSEE\t\
-SENDER_IS_OLDER\t\
-SENDER_OVER_40\t\
-ADDRESSEE_OVER_40\t\
-AGE_GAP_OVER_20\t\
-AGE_GAP\t\
-PAGE\t\
-LENGTH\t\
-TOKEN_ID\t\
-REL_TOKEN_POS\t\
-QUERY\t\
-LEFT\t\
-HIT\t\
-RIGHT\n")
-
-	records = json.load(open(input_file, "r", encoding="UTF-8"))
-
-	for nr,record in enumerate(records):
-		text = record.get("TEXT")
-		id = record.get("SERIAL_NR")
-		if not text:
-			print(f"Record {id} has no data in its 'TEXT' field and will not be queried.")
-			continue
-		if "PAGE" in record:
-			page = record.get("PAGE")
-		else:
-			page = "NA"
-		tokens = tokenize(text)
-		hits = {}
-		for i,token in enumerate(tokens):
-			token = token.lower()
-			for query in QUERIES:
-				if query in token:
-					if query in hits:
-						hits[query].append(i)
-					else:
-						hits[query] = [i]
-		for query,indices in hits.items():
-			for index in indices:
-				token_id = "%s.%s_%s"%(id, index, index)
-				left = tokens[max(index-WINDOW_SIZE, 0):index]
-				hit = tokens[index]
-				right = tokens[index+1:min(index+WINDOW_SIZE+1, len(tokens)-1)]
-				nr = int(nr)
-				open_file.write(
-					f'{id}\t'
-					f'{meta[id]["sender"]}\t'
-					f'{meta[id]["addressee"]}\t'
-					f'{meta[id]["sender-addressee_pair"]}\t'
-					f'{meta[id]["date"]}\t{meta[id]["year"]}\t'
-					f'{meta[id]["language"]}\t'
-					f'{meta[id]["gender_sender"]}\t'
-					f'{meta[id]["gender_addressee"]}\t'
-					f'{meta[id]["gender_pair"]}\t'
-					f'{meta[id]["connection_type"]}\t'
-					f'{meta[id]["generation_sender"]}\t'
-					f'{meta[id]["generation_addressee"]}\t'
-					f'{meta[id]["sender_is_older"]}\t'
-					f'{meta[id]["sender_over_40"]}\t'
-					f'{meta[id]["addressee_over_40"]}\t'
-					f'{meta[id]["age_gap_over_20"]}\t'
-					f'{meta[id]["age_gap"]}\t'
-					f'{page}\t{len(tokens)}\t'
-					f'{token_id}\t'
-					f'{round(100*index/len(tokens),2)}\t'
-					f'{query}\t'
-					f'{" ".join(left)}\t'
-					f'{hit}\t'
-					f'{" ".join(right)}\n'
-				)
+	meta = metadata_reader.load_metadata(metadata_file, args.cache_dir)
+
+	# the index holds the positions of every token type, so the queries are looked up
+	# instead of being tested against every token
+	corpus = corpus_index.load_index(input_file, args.index_file)
+	letter_hits = corpus_index.search(corpus, args.queries, args.mode)
+
+	# the metadata of every letter is looked up once, and its rows are written in one batch
+	# the corpus is read again for the contexts, one letter at a time, and only the letters with hits are tokenized
+	letter_tokens = corpus_index.read_tokens(input_file, letter_hits)
+	batches = query_dataset.hit_batches(corpus, letter_hits, letter_tokens, meta, WINDOW_SIZE)
+	if args.parquet:
+		batches = list(batches)
+		parquet_file = f"{os.path.splitext(output_file)[0]}.parquet"
+		query_dataset.save_parquet(batches, os.path.join(output_dir, parquet_file))
+		print(f"{parquet_file} written to {output_dir}.")
+	query_dataset.write_tsv(batches, output_path)
 	print(f"{output_file} written to {output_dir}.")
-	open_file.close()
\ No newline at end of file
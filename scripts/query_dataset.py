@@ -0,0 +1,157 @@
+import os
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, List, Tuple
+import pandas as pd
+import corpus_table
+
+#globals
+#the columns of the query datasets, in order
+COLUMNS = ["NR",
+           "SENDER",
+           "ADDRESSEE",
+           "SENDER-ADDRESSEE_PAIRS",
+           "DATE",
+           "YEAR",
+           "LANGUAGE",
+           "GENDER_SENDER",
+           "GENDER_ADDRESSEE",
+           "GENDER_PAIR",
+           "CONNECTION_TYPE",
+           "GENERATION_SENDER",
+           "GENERATION_ADDRESSEE",
+           "SENDER_IS_OLDER",
+           "SENDER_OVER_40",
+           "ADDRESSEE_OVER_40",
+           "AGE_GAP_OVER_20",
+           "AGE_GAP",
+           "PAGE",
+           "LENGTH",
+           "TOKEN_ID",
+           "REL_TOKEN_POS",
+           "QUERY",
+           "LEFT",
+           "HIT",
+           "RIGHT"
+           ]
+#the metadata fields (see 'metadata_reader') behind the SENDER to AGE_GAP columns
+METADATA_FIELDS = ["sender",
+                   "addressee",
+                   "sender-addressee_pair",
+                   "date",
+                   "year",
+                   "language",
+                   "gender_sender",
+                   "gender_addressee",
+                   "gender_pair",
+                   "connection_type",
+                   "generation_sender",
+                   "generation_addressee",
+                   "sender_is_older",
+                   "sender_over_40",
+                   "addressee_over_40",
+                   "age_gap_over_20",
+                   "age_gap"
+                   ]
+#the columns stored as numbers in a DataFrame or .parquet table; missing values stay empty
+INTEGER_COLUMNS = ["YEAR", "PAGE", "LENGTH"]
+FLOAT_COLUMNS = ["REL_TOKEN_POS"]
+
+def context(text: str, starts: List[int], first: int, last: int) -> str:
+    """
+    Returns the tokens 'first' up to (but not including) 'last' of a letter, joined by spaces,
+    as a slice of the joined text of the letter, given the offsets at which its tokens start.
+    """
+    if first >= last:
+        return ""
+    return text[starts[first]:starts[last] - 1]
+
+def hit_batches(index: Dict, letter_hits: Dict[int, Dict[str, List[int]]], letter_tokens: Iterable[List[str]], metadata: Dict[str, Dict], window: int) -> Iterator[Tuple[Tuple, List[Tuple]]]:
+    """
+    Turns the hits found by 'corpus_index.search' into the rows of a query dataset, with the columns
+    in COLUMNS, batched per letter: the columns that hold the metadata, page and length of a letter
+    (NR to LENGTH) are looked up once and shared by all of its hits, which only add the TOKEN_ID to RIGHT columns.
+
+    Arguments:
+        index (Dict): the index of the corpus.
+        letter_hits (Dict): the hits of every letter, as returned by 'corpus_index.search'.
+        letter_tokens (Iterable[List[str]]): the tokens of the letters with hits, in order,
+            as read by 'corpus_index.read_tokens'.
+        metadata (Dict[str, Dict]): the metadata of every letter, as read by 'metadata_reader'.
+        window (int): the number of context tokens on either side of a hit.
+
+    Returns:
+        Iterator[Tuple[Tuple, List[Tuple]]]: the letter columns and the hit columns of every letter with hits,
+        in the order of the letters and their hits.
+    """
+    letter_tokens = iter(letter_tokens)
+    for nr, letter in enumerate(index["letters"]):
+        id = letter["SERIAL_NR"]
+        if letter["length"] is None:
+            print(f"Record {id} has no data in its 'TEXT' field and will not be queried.")
+            continue
+        hits = letter_hits.get(nr)
+        if not hits:
+            continue
+        tokens = next(letter_tokens)
+
+        letter_meta = metadata[id]
+        letter_columns = (id, *(letter_meta[field] for field in METADATA_FIELDS), letter["PAGE"], len(tokens))
+        # the contexts are cut from the joined text of the letter, rather than joined for every hit
+        text = " ".join(tokens)
+        starts = list(accumulate((len(token) + 1 for token in tokens), initial=0))
+        hit_columns = []
+        for query, indices in hits.items():
+            for position in indices:
+                # the same windows as 'corpus_index.kwic', which stops the right context one token short of the end
+                left = context(text, starts, max(position-window, 0), position)
+                right = context(text, starts, position+1, min(position+window+1, len(tokens)-1))
+                hit_columns.append((f"{id}.{position}_{position}",
+                                    round(100*position/len(tokens), 2),
+                                    query,
+                                    left,
+                                    tokens[position],
+                                    right))
+        yield letter_columns, hit_columns
+
+def write_tsv(batches: Iterable[Tuple[Tuple, List[Tuple]]], output_path: str) -> int:
+    """
+    Writes the rows of a query dataset (see 'hit_batches') to a tab delimited file, under a header
+    with the COLUMNS. The letter columns are joined once per letter, and the rows of a letter
+    are written at once rather than one write per hit.
+    Returns the number of rows written.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    n_rows = 0
+    with open(output_path, "w", encoding="UTF-8") as file:
+        file.write("\t".join(COLUMNS) + "\n")
+        for letter_columns, hit_columns in batches:
+            prefix = "\t".join([str(value) for value in letter_columns])
+            file.write("".join([f"{prefix}\t{token_id}\t{position}\t{query}\t{left}\t{hit}\t{right}\n"
+                                for token_id, position, query, left, hit, right in hit_columns]))
+            n_rows += len(hit_columns)
+    return n_rows
+
+def to_frame(batches: Iterable[Tuple[Tuple, List[Tuple]]]) -> pd.DataFrame:
+    """
+    Converts the rows of a query dataset (see 'hit_batches') to a DataFrame, e.g. for the statistics notebooks.
+    The INTEGER_COLUMNS and FLOAT_COLUMNS hold numbers; all other columns hold text,
+    with missing values left empty as in the tab delimited dataset, rather than "None" or "nan".
+    """
+    rows = [letter_columns + hit for letter_columns, hit_columns in batches for hit in hit_columns]
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    for column in COLUMNS:
+        if column in INTEGER_COLUMNS:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype("Int64")
+        elif column in FLOAT_COLUMNS:
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+        else:
+            df[column] = df[column].fillna("").astype(str)
+    return df
+
+def save_parquet(batches: Iterable[Tuple[Tuple, List[Tuple]]], output_path: str):
+    """
+    Saves the rows of a query dataset as a .parquet table (see 'to_frame'). Requires pyarrow.
+    """
+    corpus_table.require_pyarrow()
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    to_frame(batches).to_parquet(output_path, index=False)
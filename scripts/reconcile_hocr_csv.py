@@ -1,43 +1,106 @@
 import os
 import argparse
-import lxml
-from lxml import etree
 import pandas as pd
+import hocr_reader
+import build_cache
 
 #globals
 HOCR_NS = "{http://www.w3.org/1999/xhtml}"
 
-def reconcile_data(hocr_dir, df, map_filename_df, output_dir):
+def build_index(annotated_df, map_filenames):
+    """
+    Builds hash tables from the annotated logical layout analysis dataframe and the
+    filename mapping, so every line can be looked up directly instead of filtering
+    the dataframes for each line. As before, only the first matching row is used.
+
+    Arguments:
+        annotated_df (pd.DataFrame): the annotated logical layout analysis dataframe.
+        map_filenames (pd.DataFrame): the mapping of the filenames to their page numbers.
+
+    Returns:
+        Tuple: three dictionaries.
+            page_status = the "pagenr" value (e.g. "ONNUTTIG") for every filename in the mapping.
+            page_numbers = the "File number" of every filename in the annotated dataframe.
+            line_index = the annotated values of every line, keyed on (Filename, Line id).
+    """
+    first_maps = map_filenames.drop_duplicates("filename")
+    page_status = dict(zip(first_maps["filename"], first_maps["pagenr"]))
+
+    first_files = annotated_df.drop_duplicates("Filename")
+    page_numbers = dict(zip(first_files["Filename"], first_files["File number"]))
+
+    #"Line correction" and "Line id correction" are not present in every dataset
+    columns = [column for column in ["Line", "Annotation", "Line correction", "Line id correction"] if column in annotated_df.columns]
+    first_lines = annotated_df.drop_duplicates(["Filename", "Line id"])
+    line_index = {}
+    for file_name, line_id, *values in zip(first_lines["Filename"], first_lines["Line id"], *(first_lines[column] for column in columns)):
+        line_index[(file_name, line_id)] = dict(zip(columns, values))
+
+    return page_status, page_numbers, line_index
+
+def slice_digests(annotated_df):
+    """
+    Hashes the rows of the annotated dataframe that belong to each file, so a page
+    only needs to be reconciled again when its own annotations were changed.
+
+    Returns:
+        Dict: the hash of the annotated rows of every filename.
+    """
+    row_hashes = pd.util.hash_pandas_object(annotated_df, index=False).to_numpy()
+    digests = {}
+    for file_name, positions in annotated_df.groupby("Filename", sort=False).indices.items():
+        digests[file_name] = build_cache.text_digest(row_hashes[positions].tobytes())
+    return digests
+
+def reconcile_data(hocr_dir, df, map_filename_df, output_dir, cache_dir=None):
     annotated_df = pd.read_csv(df,
                  delimiter=";",
                  encoding="UTF-8")
     
     map_filenames = pd.read_csv(map_filename_df,
                             delimiter=";")
+
+    page_status, page_numbers, line_index = build_index(annotated_df, map_filenames)
     
     os.makedirs(output_dir, exist_ok=True)
 
-    for file_name in os.listdir(hocr_dir):
+    #with a cache folder, pages whose .hocr file and annotations did not change
+    #since the previous run are not reconciled again
+    cache_name = f"reconcile_{os.path.basename(os.path.normpath(output_dir))}"
+    cache = build_cache.load_cache(cache_dir, cache_name)
+    digests = slice_digests(annotated_df) if cache_dir is not None else {}
+    #pages are reconciled again whenever this script changes
+    version = build_cache.file_digest(__file__) if cache_dir is not None else None
+
+    for file_name in sorted(os.listdir(hocr_dir)):
         if file_name.endswith(".hocr"):
             filepath = os.path.join(hocr_dir, file_name)
+            output_filename = os.path.join(output_dir, file_name)
 
-            tree = lxml.etree.parse(filepath)
-            root = tree.getroot()
-
-            page_info = root.find(f'.//{HOCR_NS}div[@class="ocr_page"]')
-            hocr_file_name = page_info.get("title").split('"')[1].split("\\")[-1]
+            #the image filename is kept in the cache, so unchanged files need not be opened
+            file_digest = build_cache.file_digest(filepath) if cache_dir is not None else None
+            cached_digest, hocr_file_name, cached_key = cache.get(file_name, (None, None, None))
+            if file_digest is None or file_digest != cached_digest:
+                hocr_file_name = hocr_reader.read_page(filepath).get("title").split('"')[1].split("\\")[-1]
 
-            match_filemap = map_filenames[map_filenames["filename"] == hocr_file_name]
-            if not match_filemap.empty:
-                if match_filemap.iloc[0]["pagenr"] == "ONNUTTIG":
-                    continue
+            if page_status.get(hocr_file_name) == "ONNUTTIG":
+                continue
 
-            match_filename = annotated_df[annotated_df["Filename"] == hocr_file_name]
-            if not match_filename.empty:
-                page_number = match_filename.iloc[0]["File number"]
+            if hocr_file_name in page_numbers:
+                page_number = page_numbers[hocr_file_name]
             else:
                 continue
 
+            if cache_dir is not None:
+                key = build_cache.text_digest(file_digest, digests[hocr_file_name], str(page_number), version)
+                if key == cached_key and os.path.exists(output_filename):
+                    continue
+                cache[file_name] = (file_digest, hocr_file_name, key)
+
+            tree = hocr_reader.parse_page(filepath)
+            root = tree.getroot()
+
+            page_info = root.find(f'.//{HOCR_NS}div[@class="ocr_page"]')
             page_info.set("page_number", str(page_number))
 
             for page_elem in page_info:
@@ -46,30 +109,24 @@ def reconcile_data(hocr_dir, df, map_filename_df, output_dir):
                 for line_elem in line_elements:
 
                     hocr_line = line_elem.get("id")
-                    match_line = annotated_df[(annotated_df["Filename"] == hocr_file_name) & (annotated_df["Line id"] == hocr_line)]
+                    match_line = line_index.get((hocr_file_name, hocr_line))
                     
-                    id_correction = None
                     line_content = None
-                    line_correction = None
 
                     #some entries in the dataframe are lacking the first line (id "line_1_1")
                     #investigating the .hocr files reveals that these belong to the headers.
                     #a conditional statement must prevent the script from crashing.
-                    if not match_line.empty:
-                        line_content = match_line.iloc[0]["Line"]
-                        annotation = match_line.iloc[0]["Annotation"]
+                    if match_line is not None:
+                        line_content = match_line["Line"]
+                        annotation = match_line["Annotation"]
                     else:
                         annotation = "HEADER"
+                        match_line = {}
                     
-                    #set conditionals to make the script work on both datasets
-                    if not match_line.empty and "Line correction" in match_line.columns:
-                        line_correction = match_line.iloc[0]["Line correction"]
-                    else:
-                        line_correction = None
-                    if not match_line.empty and "Line id correction" in match_line.columns:
-                        id_correction = match_line.iloc[0]["Line id correction"]
-                    else:
-                        id_correction = None
+                    #the corrections are None when the line or the column is missing,
+                    #which makes the script work on both datasets
+                    line_correction = match_line.get("Line correction")
+                    id_correction = match_line.get("Line id correction")
                 
                     #strictly it's not necessary to append the content words of the line to its
                     #upper class level, this is more laziness on my part because I don't want to
@@ -87,20 +144,22 @@ def reconcile_data(hocr_dir, df, map_filename_df, output_dir):
 
                     line_elem.set("annotation", str(annotation))
 
-                    print(f"{file_name} written to {output_dir}.")
-
-            output_filename = os.path.join(output_dir, file_name)
             tree.write(output_filename, pretty_print=True)
 
+            print(f"{file_name} written to {output_dir}.")
+
+    build_cache.save_cache(cache_dir, cache_name, cache)
+
 def main():
     p = argparse.ArgumentParser(description="Reconcile data from the annotated logical layout analysis dataframe with the original .hocr output files to create master files for the corpora.")
     p.add_argument("hocr_dir", type=str, help="Path to the folder containing the OCR output files in .hocr format.")
     p.add_argument("df", type=str, help="Path to the annotated logical layout analysis .csv file.")
     p.add_argument("map_filename_df", type=str, help="Path to the .csv containing the mapping of the filenames and their respective page numbers.")
     p.add_argument("output_dir", type=str, help="Path to the output folder.")
+    p.add_argument("--cache_dir", type=str, default=None, help="Path to the build cache folder. Only pages whose .hocr file or annotations changed since the previous run are reconciled. Optional.")
     args = p.parse_args()
 
-    reconcile_data(args.hocr_dir, args.df, args.map_filename_df, args.output_dir)
+    reconcile_data(args.hocr_dir, args.df, args.map_filename_df, args.output_dir, args.cache_dir)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
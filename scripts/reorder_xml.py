@@ -1,49 +1,101 @@
 import os
 import argparse
-from bs4 import BeautifulSoup
+from typing import Dict
+from lxml import etree
+import build_cache
 
-def reorder_xml(input_dir, output_dir=None):
+#globals
+HOCR_NS = "{http://www.w3.org/1999/xhtml}"
+
+def index_ids(root) -> Dict[str, etree._Element]:
+    """
+    Maps the id of every element on a page to the element, so the target of every
+    line that needs moving is found with a single lookup instead of a search through the page.
+    Where ids are repeated, the first element in document order is kept.
+    """
+    ids = {}
+    for elem in root.iter():
+        elem_id = elem.get("id")
+        if elem_id is not None and elem_id not in ids:
+            ids[elem_id] = elem
+    return ids
+
+def move_after(elem, target):
+    """
+    Moves an element to follow the target element directly. The text following the element
+    (its "tail" in lxml) stays where the element was, and the text that followed the target
+    now follows the moved element, so the whitespace of the layout is kept in place.
+    """
+    previous, parent = elem.getprevious(), elem.getparent()
+    if elem.tail:
+        if previous is not None:
+            previous.tail = (previous.tail or "") + elem.tail
+        else:
+            parent.text = (parent.text or "") + elem.tail
+    elem.tail, target.tail = target.tail, None
+    target.addnext(elem)
+
+def reorder_xml(input_dir, output_dir=None, cache_dir=None):
     if output_dir is None:
         output_dir = input_dir
     
     os.makedirs(output_dir, exist_ok = True)
 
-    for filename in os.listdir(input_dir):
+    #with a cache folder, the hashes of the input and output of every file are kept,
+    #so files that were already reordered are skipped. When reordering in place,
+    #an unchanged file matches the hash of the output written the previous run
+    cache_name = f"reorder_{os.path.basename(os.path.normpath(output_dir))}"
+    cache = build_cache.load_cache(cache_dir, cache_name)
+
+    for filename in sorted(os.listdir(input_dir)):
         if filename.endswith(".hocr"):
             input_path = os.path.join(input_dir, filename)
             output_path = os.path.join(output_dir, filename)
+
+            if cache_dir is not None:
+                input_digest = build_cache.file_digest(input_path)
+                cached_input, cached_output = cache.get(filename, (None, None))
+                if input_digest in [cached_input, cached_output] and os.path.exists(output_path) \
+                        and build_cache.file_digest(output_path) == cached_output:
+                    continue
             
-            with open(input_path, "r", encoding='utf-8') as file:
-                soup = BeautifulSoup(file, 'xml')
-    
+            tree = etree.parse(input_path)
+            ids = index_ids(tree.getroot())
+
             lines_to_move = []
-            for line in soup.find_all("span", class_="ocr_line"):
+            for line in tree.iter(f"{HOCR_NS}span"):
                 id_correction = line.get("id_correction")
-                if id_correction and id_correction != "nan":
+                if line.get("class") == "ocr_line" and id_correction and id_correction != "nan":
                     lines_to_move.append(line)
 
+            #the paragraph holding a corrected line is moved behind the paragraph
+            #holding the line its "id_correction" refers to (minus its last two characters)
             for line in lines_to_move:
                 id_correction = line.get("id_correction")
-                target_id = id_correction[:-2]
-                target_line = soup.find(id=target_id)
-                
-                if target_line:
-                    parent = line.parent.extract()
-                    target_line.parent.insert_after(parent)
-                
-            with open(output_path, "w", encoding="UTF-8") as file:
-                file.write(str(soup))
+                target_line = ids.get(id_correction[:-2])
+
+                if target_line is not None and target_line.getparent() is not line.getparent():
+                    move_after(line.getparent(), target_line.getparent())
+
+            #the tree is serialised straight to the output file
+            tree.write(output_path, encoding="UTF-8", xml_declaration=True)
+
+            if cache_dir is not None:
+                cache[filename] = (input_digest, build_cache.file_digest(output_path))
 
             print(f"{filename}'s .xml was reordered in {output_dir}.")
 
+    build_cache.save_cache(cache_dir, cache_name, cache)
+
 def main():
     p = argparse.ArgumentParser(description="Reorder the .xml elements of a .hocr file to ensure that all letter info \
 is clustered correctly when running the scripts to create the corpora.")
     p.add_argument("input_dir", type=str, help="Path the the input folder.")
     p.add_argument("--output_dir", type=str, help="Path to the output folder. Optional.")
+    p.add_argument("--cache_dir", type=str, default=None, help="Path to the build cache folder. Files that were already reordered are skipped. Optional.")
     args = p.parse_args()
 
-    reorder_xml(args.input_dir, args.output_dir)
+    reorder_xml(args.input_dir, args.output_dir, args.cache_dir)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,29 +1,57 @@
+import os
 import re
+import csv
+import hashlib
+import unicodedata
+from itertools import groupby
+from typing import List, Tuple, Callable, Optional, Set
 
-def clean_punct(text: str) -> str:
+#globals
+SPELLING_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spelling_rules.tsv")
+WORD = re.compile(r"\w+")
+#the stylised symbols mapped to their plain counterparts, or to None to delete them
+PUNCT_TABLE = str.maketrans({"—": "-",
+                             "‘": "'",
+                             "’": "'",
+                             "“": '"',
+                             "”": '"',
+                             "©": None,
+                             "®": None,
+                             "™": None
+                             })
+
+def normalise(text: str, nfc: bool = False) -> str:
     """
-    Normalises stylised hyphens, apostrophes, and punctuation marks.
+    Normalises stylised hyphens, apostrophes, and punctuation marks in a single pass,
+    with the translation table PUNCT_TABLE. Used for the corpora as well as for the OCR
+    output and gold standard compared by 'ocr_analysis', so both are normalised alike.
 
     Arguments:
         text (str): The text containing the symbols to be normalised.
+        nfc (bool): Also compose the characters that are written as a letter
+            followed by a combining accent (Unicode NFC).
 
     Returns:
         text (str): The text with normalised symbols.
     """
-    del_chars = ["©",
-                 "®",
-                 "™"
-                 ]
-    
-    text = text.replace("—", "-")
-    text = text.replace("‘", "'").replace("’", "'")
-    text = text.replace('“', '"').replace('”', '"')
-    
-    for char in del_chars:
-        text = text.replace(char, "")
-
+    text = text.translate(PUNCT_TABLE)
+    if nfc:
+        # after the translation, as deleted symbols may have separated a letter from its accent
+        text = unicodedata.normalize("NFC", text)
     return text
 
+def clean_punct(text: str) -> str:
+    """
+    Normalises stylised hyphens, apostrophes, and punctuation marks (see 'normalise').
+
+    Arguments:
+        text (str): The text containing the symbols to be normalised.
+
+    Returns:
+        text (str): The text with normalised symbols.
+    """
+    return normalise(text)
+
 def remove_hyphens(text: str) -> str:
     """
     Eliminates hyphenated words that appear at the end of a textline (in our case, row)
@@ -44,108 +72,176 @@ def remove_hyphens(text: str) -> str:
 
     return word
 
-def clean_spelling(text: str) -> str:
+def load_rules(rules_file: str = SPELLING_RULES) -> List[Tuple[str, str, str]]:
+    """
+    Reads the spelling correction rules from a tab delimited table.
+    Every row holds a pattern, its replacement, and a boundary flag:
+    "word" only replaces the pattern when it makes up a whole word,
+    "start" replaces it when a word starts with it, and "none" treats the
+    pattern as a regular expression that is used as is.
+
+    Arguments:
+        rules_file (str): Path to the .tsv file containing the rules.
+
+    Returns:
+        rules (list): The (pattern, replacement, boundary) tuples, in table order.
+    """
+    rules = []
+    with open(rules_file, encoding="UTF-8", newline="") as file:
+        reader = csv.DictReader(file, delimiter="\t", quoting=csv.QUOTE_NONE)
+        for row in reader:
+            rules.append((row["pattern"], row["replacement"], row["boundary"]))
+
+    return rules
+
+def compile_rules(rules: List[Tuple[str, str, str]]) -> Callable[[str], str]:
+    """
+    Compiles the spelling correction rules into a function that applies all of
+    them in a single pass over the text, so the cost no longer grows with the
+    number of rules. The text is scanned from left to right; at every position:
+        - the rules that are not tied to a single word ("none" rules, and "word" or
+          "start" patterns with other than word characters) are tried first, in table order,
+          as one alternation;
+        - only if none of them match is the word that starts there looked up in a hash table,
+          and replaced by its whole-word rule or by the first word-start rule it starts with,
+          whichever of the two is listed first in the table.
+    So table order only decides between rules of the same kind; a "none" rule always takes
+    precedence over a word rule that matches at the same position.
+    Unlike applying the rules one after the other, every rule sees the original text:
+    a replacement is never matched again by a later rule, and never stops one from matching.
+    E.g. "|[have" becomes "II have" rather than "I[have", as the "[have" rule still finds
+    the "|" before it. On the letters of both corpora, the outcome is the same
+    ('benchmark_spelling' checks this on the raw letters).
+    The function optionally takes a set of lines to leave alone, such as the lines
+    the OCR engine was confident about (see 'confident_lines'). Those lines are not
+    scanned at all; the rules run over the remaining lines only, so a rule can no
+    longer match across the line break between a skipped line and the next.
+
+    Arguments:
+        rules (list): The (pattern, replacement, boundary) tuples from 'load_rules'.
+
+    Returns:
+        Callable: A function taking a text (and the lines to skip) and returning the corrected text.
+    """
+    alternatives, replacements = [], {}
+    word_rules, prefix_rules = {}, []
+    group = 1
+    for order, (pattern, replacement, boundary) in enumerate(rules):
+        if boundary not in ["word", "start", "none"]:
+            raise ValueError(f"Invalid boundary '{boundary}' for pattern '{pattern}'. Expected 'word', 'start' or 'none'.")
+        #words made up of word characters only can be matched in the hash table
+        if boundary == "word" and WORD.fullmatch(pattern):
+            word_rules.setdefault(pattern, (order, replacement))
+            continue
+        if boundary == "start" and WORD.fullmatch(pattern):
+            prefix_rules.append((order, pattern, replacement))
+            continue
+        if boundary == "word":
+            pattern = rf"\b{re.escape(pattern)}\b"
+        elif boundary == "start":
+            pattern = rf"\b{re.escape(pattern)}"
+        alternatives.append(f"({pattern})")
+        replacements[group] = replacement
+        #skip over any groups the pattern defines itself
+        group += 1 + re.compile(pattern).groups
+    alternatives.append(f"({WORD.pattern})")
+    word_group = group
+    regex = re.compile("|".join(alternatives))
+
+    #remember the outcome for every word seen, most words recur throughout the corpus
+    memo = {}
+
+    def correct_word(word: str) -> str:
+        order, replacement = word_rules.get(word, (len(rules), word))
+        for prefix_order, prefix, prefix_replacement in prefix_rules:
+            if prefix_order < order and word.startswith(prefix):
+                order, replacement = prefix_order, prefix_replacement + word[len(prefix):]
+        memo[word] = replacement
+        return replacement
+
+    def replace(match) -> str:
+        #the outer group of the alternative that matched is always the last one to close
+        if match.lastindex == word_group:
+            word = match.group()
+            return memo.get(word) or correct_word(word)
+        return replacements[match.lastindex]
+
+    def correct(text: str, skip: Set[str] = None) -> str:
+        if not skip:
+            return regex.sub(replace, text)
+        #the lines that follow each other and are not skipped are corrected in one go
+        parts = []
+        for skipped, lines in groupby(text.split("\n"), key=lambda line: line in skip):
+            if skipped:
+                parts.extend(lines)
+            else:
+                parts.append(regex.sub(replace, "\n".join(lines)))
+        return "\n".join(parts)
+
+    return correct
+
+def rules_version(rules_file: str = SPELLING_RULES) -> str:
+    """
+    Returns a hash of the spelling correction rules and of this module's source code,
+    which changes whenever the outcome of the cleaning functions might change.
+    Used to invalidate cached, cleaned letters (see 'build_cache').
+    """
+    digest = hashlib.sha256()
+    for path in [rules_file, os.path.abspath(__file__)]:
+        with open(path, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+SPELLING_CORRECTOR = compile_rules(load_rules())
+RULES_VERSION = rules_version()
+
+def clean_spelling(text: str, skip: Set[str] = None) -> str:
     """
     Fixes recurrent errors returned by the OCR-algorithm.
     This is mostly applicable to the Marescoe-David corpus, which has a
     fine print on relatively glossy paper, causing confusion in the Tesseract engine.
+    The corrections are listed in 'spelling_rules.tsv' and are applied in a single pass.
 
     Arguments:
         text (str): Text in need of spelling correction.
+        skip (set): Lines that are left as they are, e.g. the ones returned by 'confident_lines'.
 
     Returns:
         text (str): The corrected text.
     """
-    text = re.sub(r"\B\|\B", "I", text)
-    text = re.sub(r"\bIam\b", "I am", text)
-    text = re.sub(r"\bTam\b", "I am", text)
-    text = re.sub(r"\b1am\b", "I am", text)
-    text = re.sub(r"\B\[am\b", "I am", text)
-    text = re.sub(r"\bIhave\b", "I have", text)
-    text = re.sub(r"\bThave\b", "I have", text)
-    text = re.sub(r"\B\[have\b", "I have", text)
-    text = re.sub(r"\bThaving\b", "I having", text)
-    text = re.sub(r"\B\[having\b", "I having", text)
-    text = re.sub(r"\bItrust\b", "I trust", text)
-    text = re.sub(r"\bIreceived", "I received", text)
-    text = re.sub(r"\bIremit\b", "I remit", text)
-    text = re.sub(r"\bIshall\b", "I shall", text)
-    text = re.sub(r"\bIFT\b", "If I", text)
-    text = re.sub(r"\bifI\b", "if I", text)
-    text = re.sub(r"\bandto\b", "and to", text)
-    text = re.sub(r"\bina\b", "in a", text)
-    text = re.sub(r"\bisa\b", "is a", text)
-    text = re.sub(r"\bif1\b", "if I", text)
-    text = re.sub(r"\bifit\b", "if it", text)
-    text = re.sub(r"\bIfit\b", "If it", text)
-    text = re.sub(r"\bIfand\b", "If and", text)
-    text = re.sub(r"\bifand", "if and", text)
-    text = re.sub(r"\bgota\b", "got a", text)
-    text = re.sub(r"\bnota\b", "not a", text)
-    text = re.sub(r"\bnotall\b", "not all", text)   
-    text = re.sub(r"\bNotall\b", "Not all", text)
-    text = re.sub(r"\bIfin\b", "If in", text)
-    text = re.sub(r"\bifin\b", "if in", text)
-    text = re.sub(r"\bifthe\b", "if the", text) 
-    text = re.sub(r"\bIfthe\b", "If the", text) 
-    text = re.sub(r"\blitcle\b", "little", text)
-    text = re.sub(r"\bcither\b", "either", text)
-    text = re.sub(r"\bjourncy\b", "journey", text)
-    text = re.sub(r"\bmoncy\b", "money", text)
-    text = re.sub(r"\bnamcly\b", "namely", text)
-    text = re.sub(r"\bpicces\b", "pieces", text)
-    text = re.sub(r"\bscason\b", "season", text)
-    text = re.sub(r"\btherc\b", "there", text)
-    text = re.sub(r"\bweck\b", "week", text)
-    text = re.sub(r"\byct\b", "yet", text)
-    text = re.sub(r"\bct\b", "et", text)
-    text = re.sub(r"\bmicux\b", "mieux", text)
-    text = re.sub(r"\bMicux\b", "Mieux", text)
-    text = re.sub(r"\bplusicurs\b", "plusieurs", text)   
-    text = re.sub(r"\bPlusicurs\b", "Plusieurs", text)
-    text = re.sub(r"\bJay\b", "J'ay", text)
-    text = re.sub(r"\bjay\b", "j'ay", text)
-    text = re.sub(r"\bDicu\b", "Dieu", text)   
-    text = re.sub(r"\bdicu\b", "dieu", text) 
-    text = re.sub(r"\badicu\b", "adieu", text)
-    text = re.sub(r"\bAdicu\b", "Adieu", text)
-    text = re.sub(r"\bdernicre\b", "derniere", text)
-    text = re.sub(r"\bheurcuse\b", "heureuse", text)
-    text = re.sub(r"\bMonsicur\b", "Monsieur", text)
-    text = re.sub(r"\bmonsicur\b", "monsieur", text)
-    text = re.sub(r"\bpartic\b", "partie", text)
-    text = re.sub(r"\breccu\b", "receu", text)
-    text = re.sub(r"\bLethicullier\b", "Lethieullier", text)
-    text = re.sub(r"\bLethicullier's\b", "Lethieullier's", text)  
-    text = re.sub(r"\bNorrk(?:6|é)ping\b", "Norrköping", text)
-    text = re.sub(r"\bNyk(?:6|é)ping\b", "Nyköping", text)
-    text = re.sub(r"\bLiibeck\b", "Lübeck", text)
-    text = re.sub(r"\bLitbeck\b", "Lübeck", text)
-    text = re.sub(r"\bNiirnberg\b", "Nürnberg", text)
-    text = re.sub(r"\bNiiremberg\b", "Nüremberg", text)
-    text = re.sub(r"\bGliickstadt\b", "Glückstadt", text)
-    text = re.sub(r"\bCronstr(?:6|é)m\b", "Cronström", text)
-    text = re.sub(r"\bCronstr(?:6|é)ms\b", "Cronströms", text)
-    text = re.sub(r"\bOsterby\b", "Österby", text)
-    text = re.sub(r"\bliibs\b", "lübs", text)
-    text = re.sub(r"\bStiibbing\b", "Stübbing", text)
-    text = re.sub(r"\bBacrle\b", "Baerle", text)
-    text = re.sub(r"\bsce\b", "see", text)
-    text = re.sub(r"\bsoc\b", "soe", text)
-    text = re.sub(r"\bmce\b", "mee", text)
-    text = re.sub(r"\bthey’\]\B", "they'l", text)
-    text = re.sub(r"\bIb\b", "lb", text)
-    text = re.sub(r"\bIbs\b", "lbs", text)
-    text = re.sub(r"\bSIb\b", "Slb", text)
-    text = re.sub(r"\b1oth\b", "10th", text)
-    text = re.sub(r"\b2oth\b", "20th", text)
-    text = re.sub(r"\b3oth\b", "30th", text)
-    text = re.sub(r"\br2th\b", "12th", text)
-    text = re.sub(r"\bsth\b", "5th", text)
-    text = re.sub(r"\bss\b", "5s", text)
-    text = re.sub(r"\brsth\b", "15th", text)
+    return SPELLING_CORRECTOR(text, skip)
 
-    return text
+def confident_lines(lines: List[Tuple[Tuple[str, Optional[int]], ...]], min_confidence: int) -> Set[str]:
+    """
+    Returns the lines the OCR engine was confident about: the lines of which every word
+    reached the minimum confidence value (x_wconf, 0 to 100). Manually corrected lines,
+    whose words have no confidence value, are left out.
+
+    Arguments:
+        lines (list): The (word, x_wconf) pairs of every line of a letter.
+        min_confidence (int): The confidence value from which a word counts as read correctly.
+
+    Returns:
+        lines (set): The text of the lines, with their words joined by spaces and their punctuation
+            normalised as in the letter's text, which can be skipped by 'clean_spelling'.
+    """
+    confident = set()
+    for words in lines:
+        if words and all(confidence is not None and confidence >= min_confidence for _, confidence in words):
+            confident.add(clean_punct(" ".join(word for word, _ in words)))
+
+    return confident
+
+def mean_confidence(lines: List[Tuple[Tuple[str, Optional[int]], ...]]) -> Optional[int]:
+    """
+    Returns the average OCR confidence value (x_wconf) of the words of a letter, given as
+    the (word, x_wconf) pairs of every line, rounded to a whole percentage,
+    or None if none of its words have a confidence value.
+    """
+    confidences = [confidence for words in lines for _, confidence in words if confidence is not None]
+    if not confidences:
+        return None
+    return round(sum(confidences) / len(confidences))
 
 def tokenize(text):
     """